@@ -0,0 +1 @@
+"""Read I2C and 1-Wire sensors and publish their values to MQTT."""
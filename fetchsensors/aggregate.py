@@ -0,0 +1,82 @@
+"""Windowed aggregation of sensor values for fetchsensors.
+
+A value with a window is sampled at its sensor's interval but published only
+once per window, as the mean, minimum, maximum and count of the samples.
+Short spikes between publications thus still show up in the minimum and
+maximum. The samples of each value are kept in a ring buffer that is
+allocated once, at startup, with room for exactly one window.
+"""
+
+from array import array
+from .scheduler import sensor_interval
+
+class RingBuffer:
+    """Fixed-size buffer of floats that overwrites its oldest sample when full."""
+
+    __slots__ = ('data', 'start', 'count')
+
+    def __init__(self, capacity):
+        self.data = array('d', [0.0]) * capacity
+        self.start = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def full(self):
+        return self.count == len(self.data)
+
+    def append(self, value):
+        capacity = len(self.data)
+        self.data[(self.start + self.count) % capacity] = value
+        if self.count < capacity:
+            self.count += 1
+        else:
+            self.start = (self.start + 1) % capacity
+
+    def values(self):
+        capacity = len(self.data)
+        for i in range(self.count):
+            yield self.data[(self.start + i) % capacity]
+
+    def clear(self):
+        self.start = 0
+        self.count = 0
+
+    def stats(self):
+        """Return (mean, min, max, count) of the samples."""
+        lo = hi = None
+        total = 0.0
+        for x in self.values():
+            total += x
+            lo = x if lo is None or x < lo else lo
+            hi = x if hi is None or x > hi else hi
+        return total / self.count, lo, hi, self.count
+
+def window_samples(window, interval):
+    """Return the number of samples taken in a window."""
+    return max(1, round(window / interval))
+
+class Aggregator:
+    """Ring buffers for all values with a 'window', on the value or its sensor."""
+
+    def __init__(self, sensors, interval):
+        self.buffers = {}  # id(value) -> RingBuffer
+        for s in sensors:
+            for v in s['values']:
+                window = v.get('window', s.get('window'))
+                if window:
+                    self.buffers[id(v)] = RingBuffer(window_samples(window, sensor_interval(s, interval)))
+
+    def windowed(self, v):
+        return id(v) in self.buffers
+
+    def add(self, v, value):
+        """Add a sample; return the window's (mean, min, max, count) once it is complete."""
+        buf = self.buffers[id(v)]
+        buf.append(value)
+        if not buf.full():
+            return None
+        stats = buf.stats()
+        buf.clear()
+        return stats
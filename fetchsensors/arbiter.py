@@ -0,0 +1,65 @@
+"""Priority arbitration of an I2C bus shared by several users in one process.
+
+The kernel serializes single I2C transfers, but not sequences of them: an
+OLED frame written between a multiplexer switch and the sensor transfer that
+follows it lands on the wrong channel. A BusArbiter hands the bus to one
+holder at a time; among waiting holders the one with the lowest priority
+value goes first, so sensor reads are not delayed by display frames.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+PRIORITY_SENSOR = 0
+PRIORITY_DISPLAY = 10
+
+class BusArbiter:
+    def __init__(self, name='i2c'):
+        self.name = name
+        self.cond = threading.Condition()
+        self.busy = False
+        self.waiting = []  # heap of (priority, sequence)
+        self.sequence = itertools.count()
+        self.holds = {}    # priority -> (count, seconds waited)
+
+    def acquire(self, priority):
+        ticket = (priority, next(self.sequence))
+        start = time.monotonic()
+        with self.cond:
+            heapq.heappush(self.waiting, ticket)
+            while self.busy or self.waiting[0] != ticket:
+                self.cond.wait()
+            heapq.heappop(self.waiting)
+            self.busy = True
+            count, waited = self.holds.get(priority, (0, 0.0))
+            self.holds[priority] = (count + 1, waited + time.monotonic() - start)
+
+    def release(self):
+        with self.cond:
+            self.busy = False
+            self.cond.notify_all()
+
+    def handle(self, priority):
+        """Return a reusable context manager that holds the bus at priority."""
+        return ArbiterHandle(self, priority)
+
+    def stats(self):
+        with self.cond:
+            holds = sorted(self.holds.items())
+        return f"{self.name} " + ', '.join(f"priority {p}: {count} holds, {waited * 1000:.1f} ms waited"
+                                           for p, (count, waited) in holds)
+
+class ArbiterHandle:
+    def __init__(self, arbiter, priority):
+        self.arbiter = arbiter
+        self.priority = priority
+
+    def __enter__(self):
+        self.arbiter.acquire(self.priority)
+        return self
+
+    def __exit__(self, *exc):
+        self.arbiter.release()
+        return False
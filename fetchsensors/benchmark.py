@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+"""Benchmark the fetchsensors read and publish loop on simulated hardware.
+
+Runs the real SensorReaders, AcquisitionScheduler and Publisher against
+FakeSMBus buses, a FakeW1Tree and a LocalBroker for configurations of
+increasing size, and reports cycle latency, bus occupancy, publish
+throughput and memory.
+"""
+
+import argparse
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import paho.mqtt.client as mqtt
+from .drivers import SENSOR_SI7021, SENSOR_HTU21, SENSOR_BME280
+from .discovery import I2C_SENSORS
+from .publisher import Publisher, compile_lines, sensor_lines
+from .readers import SensorReaders, refineSensorConfig, w1_trigger
+from .scheduler import AcquisitionScheduler
+from .simulation import FakeSMBus, FakeI2cDevice, FakeSensor, FakeBME280, FakeW1Tree, LocalBroker
+from .simulation import TRANSACTION_LATENCY, DS18B20_CONVERSION
+
+SIZES = [1, 2, 4, 8, 16, 32, 64]
+CHANNELS_PER_BUS = 8
+I2C_TYPES = [SENSOR_HTU21, SENSOR_SI7021, SENSOR_BME280]
+
+def build_config(count):
+    """Return the sensors of a node with count sensors, half of them on I2C.
+
+    I2C sensors rotate through HTU21, Si7021 and BME280 and fill the 8
+    channels of a multiplexer per bus, starting at bus 1; the rest are
+    DS18B20 probes.
+    """
+    sensors = []
+    i2c_count = count // 2
+    for i in range(i2c_count):
+        sensor_type = I2C_TYPES[i % len(I2C_TYPES)]
+        sensors.append({
+            "id": I2C_SENSORS[sensor_type]["address"],
+            "bus": 1 + i // CHANNELS_PER_BUS,
+            "channel": i % CHANNELS_PER_BUS,
+            "sensor": sensor_type,
+            "enabled": 1,
+            "location": f"bench_i2c_{i}",
+            "values": [dict(v) for v in I2C_SENSORS[sensor_type]["values"]]
+        })
+    for i in range(count - i2c_count):
+        sensors.append({
+            "id": f"28-bench{i:08x}",
+            "sensor": "DS18B20",
+            "enabled": 1,
+            "location": f"bench_w1_{i}",
+            "values": [
+                {"correction": 0.0, "measurand": "temperature"}
+            ]
+        })
+    return compile_lines(refineSensorConfig(sensors), 'bench')
+
+def build_buses(sensors, latency):
+    buses = {}
+    for s in sensors:
+        if s['i2c']:
+            bus = buses.setdefault(s['bus'], FakeSMBus(s['bus'], latency=latency))
+            fake = FakeBME280() if s['sensor'] == SENSOR_BME280 else FakeSensor(s['sensor'])
+            bus.sensors[(s.get('channel'), s['id'])] = fake
+    return buses
+
+def run(count, cycles, latency, w1_conversion, batch, broker, w1_dir, w1_bulk=False):
+    sensors = build_config(count)
+    buses = build_buses(sensors, latency)
+    tree = FakeW1Tree(w1_dir, [s['id'] for s in sensors if not s['i2c']], conversion_time=w1_conversion)
+    readers = SensorReaders(sensors,
+                            bus_factory=lambda n: buses[n],
+                            device_factory=lambda n, address: FakeI2cDevice(buses[n], address),
+                            w1_devices=w1_dir, w1_bulk=w1_bulk, w1_trigger=tree.wrap_trigger(w1_trigger))
+    scheduler = AcquisitionScheduler(sensors, tree.wrap(readers.read_sensor), readers.read_bus,
+                                     read_w1=readers.read_w1 if readers.w1_bulk else None)
+
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    client.connect(broker.host, broker.port, 60)
+    client.loop_start()
+    while not client.is_connected():
+        time.sleep(0.001)
+    publisher = Publisher(client, 'bench', batch=batch)
+    broker.reset()
+
+    cycle_times = []
+    publish_times = []
+    lines_sent = 0
+    tracemalloc.start()
+    for _ in range(cycles):
+        cycle_times.append(scheduler.run_cycle())
+        start = time.perf_counter()
+        for item in sensors:
+            lines, _ = sensor_lines(item)
+            for msg in lines:
+                publisher.add(msg, item['timestamp'])
+                lines_sent += 1
+        publisher.flush()
+        broker.wait_for(publisher.messages)
+        publish_times.append(time.perf_counter() - start)
+        readers.mux_stats()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    client.loop_stop()
+    client.disconnect()
+    scheduler.shutdown()
+
+    busy = max((b.busy for b in buses.values()), default=0.0)
+    return {
+        'sensors': count,
+        'cycle_mean': statistics.mean(cycle_times),
+        'cycle_max': max(cycle_times),
+        'occupancy': busy / sum(cycle_times) if sum(cycle_times) else 0.0,
+        'transactions': sum(b.transactions for b in buses.values()) / cycles,
+        'publish_rate': lines_sent / sum(publish_times) if sum(publish_times) else 0.0,
+        'messages': broker.messages / cycles,
+        'peak_kib': peak / 1024,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the fetchsensors read loop on simulated hardware')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='numbers of sensors to benchmark')
+    parser.add_argument('--cycles', type=int, default=3, help='cycles per configuration')
+    parser.add_argument('--latency', type=float, default=TRANSACTION_LATENCY, help='seconds per I2C transaction')
+    parser.add_argument('--w1-conversion', type=float, default=DS18B20_CONVERSION, help='seconds per DS18B20 read')
+    parser.add_argument('--batch', action='store_true', help='publish one batch message per cycle')
+    parser.add_argument('--w1-bulk', action='store_true',
+                        help='convert all DS18B20 at once, taking one --w1-conversion per cycle')
+    args = parser.parse_args()
+
+    broker = LocalBroker().start()
+    print(f"{'sensors':>7} {'cycle ms':>9} {'max ms':>9} {'bus busy':>8} {'i2c tx':>7} "
+          f"{'lines/s':>9} {'msgs':>5} {'peak KiB':>9}")
+    try:
+        for count in args.sizes:
+            with tempfile.TemporaryDirectory() as w1_dir:
+                r = run(count, args.cycles, args.latency, args.w1_conversion, args.batch, broker, w1_dir,
+                        args.w1_bulk)
+            print(f"{r['sensors']:>7} {r['cycle_mean'] * 1000:>9.1f} {r['cycle_max'] * 1000:>9.1f} "
+                  f"{r['occupancy'] * 100:>7.1f}% {r['transactions']:>7.0f} {r['publish_rate']:>9.0f} "
+                  f"{r['messages']:>5.0f} {r['peak_kib']:>9.1f}")
+    finally:
+        broker.stop()
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"max RSS {rss} KiB", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
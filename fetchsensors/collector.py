@@ -0,0 +1,219 @@
+"""The read and publish loop of fetchsensors.
+
+A Collector owns everything a running fetchsensors needs: the MQTT client,
+publisher and spool, metrics, and the SensorPlan compiled from the sensors
+configuration. step() reads the due sensors and publishes their values;
+fetchsensors.py calls it in a loop, and the combined raspistatus daemon calls
+it from an asyncio task. When the configuration file changes, the plan is
+rebuilt and swapped in between two steps, without touching the MQTT
+connection.
+"""
+
+import sys
+import time
+from .metrics import Metrics, MetricsServer, MetricsPublisher, METRICS_ADDRESS, METRICS_INTERVAL
+from .plan import SensorPlan, ConfigWatcher, read_config, RELOAD_CHECK, RESTART_SECTIONS
+from .publisher import Publisher, REPLAY_RATE, sensor_lines
+from .spool import Spool
+
+LOG_INTERVAL = 60  # seconds between logged reads
+
+def printMuxStats(readers):
+    stats = [f"bus {bus_num}: {switches} channel switches, {skipped} skipped"
+             for bus_num, switches, skipped in readers.mux_stats()]
+    if stats:
+        print('mux ' + '; '.join(stats))
+
+def printDeadbandStats(deadband):
+    print(f"values {deadband.sent} sent, {deadband.suppressed} suppressed")
+
+def printHealthStats(health):
+    if health.published or health.suppressed or health.failed:
+        print(f"errors {health.published} published, {health.suppressed} suppressed, "
+              f"{health.backing_off()} sensor(s) backing off")
+
+def printErr(msg):
+    print('ERROR - ' + msg, file=sys.stderr)
+
+class Collector:
+    """Read the configured sensors and publish their values.
+
+    arbiters maps bus numbers to BusArbiters for buses shared with other
+    users in the process. on_lines, if given, is called with the records of
+    every step that are not errors. With config_file, the file is checked for
+    changes every RELOAD_CHECK seconds and reloaded.
+    """
+
+    def __init__(self, config, sensors, is_dry_run=False, arbiters=None, on_lines=None, config_file=None):
+        self.config = config
+        self.is_dry_run = is_dry_run
+        self.arbiters = arbiters
+        self.on_lines = on_lines
+
+        self.metrics = Metrics(config['node'])
+        metrics_config = config.get('metrics', {})
+        self.metrics_server = None
+        if 'port' in metrics_config:
+            try:
+                self.metrics_server = MetricsServer(self.metrics, metrics_config['port'],
+                                                    metrics_config.get('address', METRICS_ADDRESS)).start()
+            except OSError as e:
+                printErr('cannot serve metrics: ' + str(e))
+
+        self.client = None
+        self.spool = None
+        self.publisher = None
+        self.metrics_publisher = None
+        if not is_dry_run:
+            import paho.mqtt.client as mqtt
+            self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+
+            # Set access token
+            # client.username_pw_set(ACCESS_TOKEN)
+
+            # Connect default MQTT port and 60 seconds keepalive interval. The network
+            # loop keeps reconnecting in the background, so the broker does not need
+            # to be reachable at startup.
+            self.client.reconnect_delay_set(min_delay=1, max_delay=60)
+            self.client.connect_async(config['mqtt']['server'], 1883, 60)
+            self.client.loop_start()
+
+            if 'spool' in config:
+                try:
+                    self.spool = Spool.from_config(config['spool'])
+                except OSError as e:
+                    printErr('cannot use spool directory: ' + str(e))
+
+            self.publisher = Publisher.from_config(self.client, config['mqtt'], self.spool,
+                                                   config.get('spool', {}).get('replay_rate', REPLAY_RATE),
+                                                   self.metrics)
+
+            if 'topic' in metrics_config:
+                self.metrics_publisher = MetricsPublisher(self.client, metrics_config['topic'], self.metrics,
+                                                          metrics_config.get('interval', METRICS_INTERVAL))
+
+        self.plan = SensorPlan(config, sensors, arbiters, self.metrics)
+        if self.plan.readers.buses:
+            # let the freshly opened buses settle; nothing may count as missed meanwhile
+            time.sleep(2)
+            self.plan.scheduler.restart()
+
+        self.watcher = ConfigWatcher(config_file) if config_file is not None else None
+        self.next_check = time.monotonic() + RELOAD_CHECK
+        self.configure_log(config)
+        self.next_log = 0.0
+
+    def configure_log(self, config):
+        log_config = config.get('log', {})
+        self.log_readings = log_config.get('readings', True)
+        # a dry run is for looking at the readings
+        self.log_interval = 0 if self.is_dry_run else log_config.get('interval', LOG_INTERVAL)
+
+    def maybe_reload(self):
+        """Reload the configuration if its file changed since the last check."""
+        if self.watcher is None:
+            return
+        now = time.monotonic()
+        if now < self.next_check:
+            return
+        self.next_check = now + RELOAD_CHECK
+        if self.watcher.changed():
+            self.reload()
+
+    def reload(self):
+        """Build a plan from the configuration file and swap it in, keeping the current one on errors."""
+        config_file = self.watcher.path
+        try:
+            config, sensors = read_config(config_file)
+            plan = SensorPlan(config, sensors, self.arbiters, self.metrics)
+        except Exception as e:
+            printErr(f'cannot reload config file "{config_file}", keeping the current one: {e!r}')
+            return
+        for section in RESTART_SECTIONS:
+            if config.get(section) != self.config.get(section):
+                print(f"WARN - '{section}' in {config_file} changed, restart to apply it", file=sys.stderr)
+        old, self.plan = self.plan, plan
+        self.config = config
+        self.metrics.node = plan.node
+        self.configure_log(config)
+        old.close()
+        print(f"reloaded {config_file}: {len(plan.sensors)} sensors")
+
+    def step(self):
+        """Read the sensors that are due and publish their values."""
+        self.maybe_reload()
+        plan = self.plan
+        due = plan.scheduler.run_due()
+
+        now = time.monotonic()
+        log = bool(due) and now >= self.next_log
+        if log:
+            self.next_log = now + self.log_interval
+
+        published = []
+        readings = []
+        for item in due:
+            lines, is_error = sensor_lines(item, plan.deadband, plan.aggregator)
+            if is_error:
+                self.metrics.count_error(item['error']['type'])
+                if not plan.health.report_error(item):
+                    continue
+                print('\n'.join(lines), file=sys.stderr)
+            elif log and self.log_readings:
+                readings += lines
+            if not self.is_dry_run:
+                for msg in lines:
+                    self.publisher.add(msg, item['timestamp'])
+            if not is_error:
+                published += lines
+        if readings:
+            print('\n'.join(readings))
+
+        if not self.is_dry_run:
+            self.publisher.flush()
+            if self.metrics_publisher is not None:
+                self.metrics_publisher.maybe_publish()
+
+        if due:
+            plan.scheduler.report(log)
+        if log:
+            printMuxStats(plan.readers)
+            printDeadbandStats(plan.deadband)
+            printHealthStats(plan.health)
+        if published and self.on_lines is not None:
+            self.on_lines(published)
+        return due
+
+    def next_deadline(self):
+        """Return when step() has something to do next, None if never."""
+        deadline = self.plan.scheduler.next_deadline()
+        if self.watcher is None:
+            return deadline
+        return self.next_check if deadline is None else min(deadline, self.next_check)
+
+    def wait(self):
+        """Sleep until step() has something to do."""
+        deadline = self.next_deadline()
+        delay = RELOAD_CHECK if deadline is None else deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def run(self):
+        """Read and publish until interrupted."""
+        try:
+            while True:
+                self.step()
+                self.wait()
+        except KeyboardInterrupt:
+            pass
+
+    def close(self):
+        self.plan.close()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+
+        if not self.is_dry_run:
+            self.client.loop_stop()
+            self.client.disconnect()
+            if self.spool is not None:
+                self.spool.close()
@@ -0,0 +1,50 @@
+"""Report-on-change filtering of sensor values for fetchsensors.
+
+A value with a deadband is only published when it differs from the value
+last published for it by more than the deadband, or when nothing has been
+published for it for heartbeat seconds, so its series never goes stale.
+Values without a deadband are always published.
+"""
+
+import time
+
+HEARTBEAT = 600  # seconds
+
+class Deadband:
+    """Decide per value whether a reading is worth publishing.
+
+    defaults maps a measurand to the absolute deadband of values that do not
+    set their own 'deadband' or 'deadband_percent'.
+    """
+
+    def __init__(self, defaults=None, heartbeat=HEARTBEAT, clock=time.monotonic):
+        self.defaults = defaults or {}
+        self.heartbeat = heartbeat
+        self.clock = clock
+        self.last = {}  # id(value) -> (published value, monotonic time)
+        self.sent = 0
+        self.suppressed = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get('deadband', {}), config.get('heartbeat', HEARTBEAT))
+
+    def band(self, v, reference):
+        absolute = v.get('deadband', self.defaults.get(v['measurand'], 0))
+        relative = abs(reference) * v.get('deadband_percent', 0) / 100
+        return max(absolute, relative)
+
+    def report(self, v, value):
+        """Return True if value should be published, counting the decision."""
+        now = self.clock()
+        key = id(v)
+        last = self.last.get(key)
+        if last is not None:
+            reference, published = last
+            band = self.band(v, reference)
+            if band and abs(value - reference) <= band and now - published < self.heartbeat:
+                self.suppressed += 1
+                return False
+        self.last[key] = (value, now)
+        self.sent += 1
+        return True
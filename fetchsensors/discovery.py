@@ -0,0 +1,215 @@
+"""Sensor discovery for fetchsensors --generate.
+
+I2C devices are found with in-process SMBus probes, the same quick-write and
+read-byte probes i2cdetect uses, instead of running i2cdetect once per bus and
+multiplexer channel. All buses are scanned concurrently. Behind a TCA9548A
+the bus is first scanned with all channels off, so devices that sit directly
+on the bus are reported once and not again for every channel.
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from .drivers import SENSOR_SI7021, SENSOR_HTU21, SENSOR_BME280
+from .mux import I2cMux, MUX_ADDRESS
+from .readers import open_smbus
+
+I2C_BUSES = [0, 1]
+MUX_CHANNELS = 8
+# addresses i2cdetect scans by default
+FIRST_ADDRESS = 0x08
+LAST_ADDRESS = 0x77
+
+# Sensor type definitions
+I2C_SENSORS = {
+    SENSOR_HTU21: {
+        "address": 0x40,
+        "name": "HTU21",
+        "values": [
+            {"measurand": "temperature", "correction": 0.0},
+            {"measurand": "humidity", "correction": 0.0}
+        ]
+    },
+    SENSOR_SI7021: {
+        "address": 0x40,
+        "name": "SI7021",
+        "values": [
+            {"measurand": "temperature", "correction": 0.0},
+            {"measurand": "humidity", "correction": 0.0}
+        ]
+    },
+    SENSOR_BME280: {
+        "address": 0x76,  # Also check 0x77 as alternate address
+        "alternate_address": 0x77,
+        "name": "BME280",
+        "values": [
+            {"measurand": "temperature", "correction": 0.0},
+            {"measurand": "humidity", "correction": 0.0},
+            {"measurand": "pressure", "correction": 0.0}
+        ]
+    }
+}
+
+def create_sensor_config(sensor_type, bus_num, address, channel=None):
+    """Create a configuration dictionary for a sensor."""
+    sensor_info = I2C_SENSORS[sensor_type]
+    config = {
+        "id": address,
+        "bus": bus_num,
+        "sensor": sensor_type,
+        "enabled": 1,
+        "values": [dict(v) for v in sensor_info["values"]]
+    }
+
+    # Add channel if using multiplexer
+    if channel is not None:
+        config["channel"] = channel
+        config["location"] = f"i2c_{bus_num}_ch{channel}"
+    else:
+        config["location"] = f"i2c_{bus_num}"
+
+    return config
+
+def probe(bus, address):
+    """Return True if a device acknowledges address, probing like i2cdetect."""
+    try:
+        if 0x30 <= address <= 0x37 or 0x50 <= address <= 0x5F:
+            # quick write can corrupt EEPROMs, read a byte instead
+            bus.read_byte(address)
+        else:
+            bus.write_quick(address)
+        return True
+    except OSError:
+        return False
+
+def probe_addresses(bus, exclude=()):
+    """Return all addresses on the bus that acknowledge a probe."""
+    return [a for a in range(FIRST_ADDRESS, LAST_ADDRESS + 1) if a not in exclude and probe(bus, a)]
+
+def detect_sensor_type(bus, bus_num, address):
+    """Detect the type of sensor at a given address."""
+    if address == 0x40:  # Special handling for HTU21/SI7021 which share the same address
+        try:
+            # Read the device ID to distinguish between HTU21 and SI7021
+            # First, send the read ID command
+            bus.write_i2c_block_data(0x40, 0xFA, [0x0F])
+            time.sleep(0.01)
+            # Read the ID
+            data = bus.read_i2c_block_data(0x40, 0, 8)
+
+            # SI7021 and HTU21 have different ID patterns
+            if data[0] == 0x15:  # SI7021 ID
+                return SENSOR_SI7021
+        except OSError:
+            # If we can't read the ID but we know a device exists, quietly default to HTU21
+            pass
+        return SENSOR_HTU21
+
+    # For other addresses, check against known sensor types
+    for sensor_type, info in I2C_SENSORS.items():
+        if address == info["address"] or address == info.get("alternate_address"):
+            return sensor_type
+    return None
+
+class BusScan:
+    """Devices and timing of the scan of one bus."""
+
+    def __init__(self, bus_num):
+        self.bus_num = bus_num
+        self.mux = False
+        self.devices = {}  # channel (None: directly on the bus) -> addresses
+        self.sensors = []
+        self.timing = {}   # step -> seconds
+        self.error = None
+
+    def add(self, bus, channel, addresses):
+        self.devices[channel] = addresses
+        for address in addresses:
+            sensor_type = detect_sensor_type(bus, self.bus_num, address)
+            if sensor_type:
+                self.sensors.append(create_sensor_config(sensor_type, self.bus_num, address, channel))
+
+def scan_bus(bus_num):
+    """Scan a bus and all channels of a multiplexer on it."""
+    scan = BusScan(bus_num)
+    start = time.monotonic()
+    try:
+        bus = open_smbus(bus_num)
+    except OSError as e:
+        scan.error = e
+        return scan
+    try:
+        scan.mux = probe(bus, MUX_ADDRESS)
+        if not scan.mux:
+            scan.add(bus, None, probe_addresses(bus))
+            scan.timing['direct'] = time.monotonic() - start
+            return scan
+
+        mux = I2cMux(bus)
+        mux.disable()
+        scan.add(bus, None, probe_addresses(bus, exclude=(MUX_ADDRESS,)))
+        scan.timing['direct'] = time.monotonic() - start
+        direct = set(scan.devices[None]) | {MUX_ADDRESS}
+        for channel in range(MUX_CHANNELS):
+            t = time.monotonic()
+            mux.select(channel)
+            scan.add(bus, channel, probe_addresses(bus, exclude=direct))
+            scan.timing[f"channel {channel}"] = time.monotonic() - t
+        mux.disable()
+    except OSError as e:
+        scan.error = e
+    finally:
+        bus.close()
+        scan.timing['total'] = time.monotonic() - start
+    return scan
+
+def print_scan(scan):
+    if scan.error is not None:
+        print(f"Error scanning bus {scan.bus_num}: {scan.error}", file=sys.stderr)
+    for channel, addresses in scan.devices.items():
+        where = f"bus {scan.bus_num}" if channel is None else f"bus {scan.bus_num}, channel {channel}"
+        found = ' '.join(f"0x{a:02x}" for a in addresses) or '-'
+        print(f"{where}: {found}")
+    for sensor in scan.sensors:
+        print(f"Found {sensor['sensor']} at 0x{sensor['id']:02x} on {sensor['location']}")
+    timing = ', '.join(f"{step} {seconds:.2f}s" for step, seconds in scan.timing.items())
+    print(f"bus {scan.bus_num} scan timing: {timing}")
+
+def detect_i2c_sensors(buses=None):
+    """Detect I2C sensors on all available busses, including multiplexed channels."""
+    if buses is None:
+        buses = [n for n in I2C_BUSES if os.path.exists(f"/dev/i2c-{n}")]
+    if not buses:
+        return []
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=len(buses)) as pool:
+        scans = list(pool.map(scan_bus, buses))
+    sensors = []
+    for scan in scans:
+        print_scan(scan)
+        sensors.extend(scan.sensors)
+    print(f"I2C scan of {len(buses)} buses took {time.monotonic() - start:.2f}s")
+    return sensors
+
+def create_w1_sensor_config(device_id):
+    """Create a configuration dictionary for a DS18B20."""
+    return {
+        "id": device_id,
+        "sensor": "DS18B20",
+        "enabled": 1,
+        "location": f"wire1_{device_id}",
+        "values": [
+            {"correction": 0.0, "measurand": "temperature"}
+        ]
+    }
+
+def detect_w1_sensors():
+    """Detect 1-Wire temperature sensors."""
+    sensors = []
+    w1_devices = Path('/sys/bus/w1/devices')
+    if w1_devices.exists():
+        for device in w1_devices.glob('28-*'):  # 28- is the family code for DS18B20
+            sensors.append(create_w1_sensor_config(device.name))
+    return sensors
@@ -0,0 +1,333 @@
+"""Non-blocking I2C sensor drivers for fetchsensors.
+
+A driver splits a reading into start() and poll() steps. start() triggers a
+conversion in no-hold-master mode and returns immediately; poll() fetches the
+result once the datasheet conversion time has passed. measure_all() runs the
+drivers of one bus interleaved, so the bus is only busy for the few
+milliseconds of the actual transfers.
+
+The BME280 is register based and is driven over smbus in forced mode: one
+write triggers a measurement of all three values, one burst read fetches
+them. Its calibration is read once per device and kept in precomputed form.
+"""
+
+import errno
+import struct
+import time
+from contextlib import nullcontext
+
+SENSOR_SI7021 = 'Si7021'
+SENSOR_HTU21 = 'HTU21'
+SENSOR_BME280 = 'BME280'
+
+CMD_MEASURE_RH_NO_HOLD = 0xF5
+CMD_MEASURE_TEMP_NO_HOLD = 0xF3
+CMD_READ_TEMP_FROM_RH = 0xE0  # Si7021 only
+
+# a read before the conversion is complete is NACKed, retry a few times
+POLL_RETRY = 0.005
+MAX_POLL_RETRIES = 20
+
+IDLE = 'idle'
+HUMIDITY = 'humidity'
+TEMPERATURE = 'temperature'
+DONE = 'done'
+
+_devices = {}
+
+def open_device(bus_num, address):
+    """Return a shared raw I2C handle for an address on a bus."""
+    from htu21.rawi2c import I2C
+    key = (bus_num, address)
+    if key not in _devices:
+        _devices[key] = I2C(address, bus_num)
+    return _devices[key]
+
+class SMBusDevice:
+    """Register access to one address on an smbus bus."""
+
+    def __init__(self, bus, address):
+        self.bus = bus
+        self.address = address
+
+    def read(self, register, length):
+        return bytes(self.bus.read_i2c_block_data(self.address, register, length))
+
+    def write(self, register, data):
+        self.bus.write_i2c_block_data(self.address, register, list(data))
+
+def rh_from_raw(raw):
+    return ((raw & 0xFFFC) * 125 / 65536.0) - 6
+
+def temperature_from_raw(raw):
+    return ((raw & 0xFFFC) * 175.72 / 65536.0) - 46.85
+
+class HumiditySensor:
+    """Measurement state machine shared by the HTU21 and the Si7021.
+
+    Both use the same commands; they differ in conversion times and in
+    whether the temperature of the humidity measurement can be read back.
+    """
+
+    # maximum conversion times from the datasheet (RH 12 bit, T 14 bit)
+    humidity_time = 0.016
+    temperature_time = 0.050
+    temperature_from_rh = False
+    uses_smbus = False
+
+    def __init__(self, dev, channel=None):
+        self.dev = dev
+        self.channel = channel
+        self.state = IDLE
+        self.due = 0.0
+        self.retries = 0
+        self.humidity = None
+        self.temperature = None
+        self.error = None
+        self.acquired = None  # time.time_ns() of the last completed reading
+
+    def _trigger(self, cmd, state, duration, now):
+        self.dev.write(cmd)
+        self.state = state
+        self.due = now + duration
+        self.retries = 0
+
+    def start(self, now):
+        """Trigger a humidity conversion."""
+        self.error = None
+        self._trigger(CMD_MEASURE_RH_NO_HOLD, HUMIDITY, self.humidity_time, now)
+
+    def _read_result(self, now):
+        try:
+            return self.dev.read_int(2, crc8=True)
+        except OSError as e:
+            # a NACK has an errno (EREMOTEIO/ENXIO), a CRC8Error has none
+            if e.errno is None:
+                raise
+            self.retries += 1
+            if self.retries > MAX_POLL_RETRIES:
+                raise
+            self.due = now + POLL_RETRY
+            return None
+
+    def poll(self, now):
+        """Advance the measurement if it is due, return True once finished."""
+        if self.state in (IDLE, DONE) or now < self.due:
+            return self.state == DONE
+        raw = self._read_result(now)
+        if raw is None:
+            return False
+        if self.state == HUMIDITY:
+            self.humidity = rh_from_raw(raw)
+            if self.temperature_from_rh:
+                self.dev.write(CMD_READ_TEMP_FROM_RH)
+                self.temperature = temperature_from_raw(self.dev.read_int(2))
+                self.state = DONE
+            else:
+                self._trigger(CMD_MEASURE_TEMP_NO_HOLD, TEMPERATURE, self.temperature_time, now)
+        else:
+            self.temperature = temperature_from_raw(raw)
+            self.state = DONE
+        return self.state == DONE
+
+    def fail(self, exc):
+        self.error = exc
+        self.state = IDLE
+
+    def results(self):
+        """Values in the order of the sensor's 'values' in sensors.json."""
+        return [self.temperature, self.humidity]
+
+class HTU21Sensor(HumiditySensor):
+    humidity_time = 0.016
+    temperature_time = 0.050
+
+class Si7021Sensor(HumiditySensor):
+    # the RH conversion includes a temperature conversion (12 ms + 10.8 ms)
+    humidity_time = 0.023
+    temperature_time = 0.011
+    temperature_from_rh = True
+
+BME280_CHIP_ID = 0x60
+BME280_REG_CHIP_ID = 0xD0
+BME280_REG_CALIB_TP = 0x88   # 0x88..0xA1, T1..T3, P1..P9, H1 at 0xA1
+BME280_REG_CALIB_H = 0xE1    # 0xE1..0xE7, H2..H6
+BME280_REG_CTRL_HUM = 0xF2
+BME280_REG_CTRL_MEAS = 0xF4
+BME280_REG_DATA = 0xF7       # 0xF7..0xFE, press, temp, hum
+BME280_OVERSAMPLING_X1 = 1
+BME280_MODE_FORCED = 1
+BME280_SKIPPED = 0x80000
+
+class BME280Calibration:
+    """Trim parameters of a BME280, reduced to the factors the compensation needs.
+
+    The formulas are the floating point compensation of the datasheet
+    (section 8.1) with every term that only depends on the trim parameters
+    computed once here.
+    """
+
+    def __init__(self, tp, h):
+        (t1, t2, t3, p1, p2, p3, p4, p5, p6, p7, p8, p9) = struct.unpack('<HhhHhhhhhhhh', tp[:24])
+        h1 = tp[25]
+        h2, h3 = struct.unpack('<hB', h[:3])
+        h4 = (h[3] << 4) | (h[4] & 0x0F)
+        h5 = (h[5] << 4) | (h[4] >> 4)
+        h4 = h4 - 0x1000 if h4 & 0x800 else h4
+        h5 = h5 - 0x1000 if h5 & 0x800 else h5
+        h6 = struct.unpack('<b', h[6:7])[0]
+
+        self.t_a = t2 / 16384.0
+        self.t_b = t1 / 1024.0 * t2
+        self.t_c = t1 / 8192.0
+        self.t_d = float(t3)
+        self.p1 = float(p1)
+        self.p_var2_a = p6 / 32768.0
+        self.p_var2_b = p5 * 2.0
+        self.p_var2_c = p4 * 65536.0
+        self.p_var1_a = p3 / 524288.0
+        self.p_var1_b = float(p2)
+        self.p9 = p9 / 2147483648.0
+        self.p8 = p8 / 32768.0
+        self.p7 = float(p7)
+        self.h_a = h4 * 64.0
+        self.h_b = h5 / 16384.0
+        self.h_c = h2 / 65536.0
+        self.h_d = h6 / 67108864.0
+        self.h_e = h3 / 67108864.0
+        self.h_f = h1 / 524288.0
+
+    def compensate(self, adc_t, adc_p, adc_h):
+        """Return temperature in °C, pressure in hPa and relative humidity in %."""
+        x = adc_t / 131072.0 - self.t_c
+        t_fine = adc_t * self.t_a - self.t_b + x * x * self.t_d
+        temperature = t_fine / 5120.0
+
+        var1 = t_fine / 2.0 - 64000.0
+        var2 = (var1 * var1 * self.p_var2_a + var1 * self.p_var2_b) / 4.0 + self.p_var2_c
+        var1 = (self.p_var1_a * var1 * var1 + self.p_var1_b * var1) / 524288.0
+        var1 = (1.0 + var1 / 32768.0) * self.p1
+        if var1 == 0:
+            pressure = 0.0
+        else:
+            p = (1048576.0 - adc_p - var2 / 4096.0) * 6250.0 / var1
+            pressure = (p + (self.p9 * p * p + p * self.p8 + self.p7) / 16.0) / 100.0
+
+        v = t_fine - 76800.0
+        v = (adc_h - (self.h_a + self.h_b * v)) * (self.h_c * (1.0 + self.h_d * v * (1.0 + self.h_e * v)))
+        humidity = min(max(v * (1.0 - self.h_f * v), 0.0), 100.0)
+
+        return temperature, pressure, humidity
+
+class BME280Sensor:
+    """BME280 in forced mode with 1x oversampling of all three values."""
+
+    uses_smbus = True
+    # maximum measurement time with 1x oversampling: 1.25 + 3 * 2.3 + 2 * 0.575 ms
+    measure_time = 0.010
+
+    def __init__(self, dev, channel=None):
+        self.dev = dev
+        self.channel = channel
+        self.calibration = None
+        self.state = IDLE
+        self.due = 0.0
+        self.temperature = None
+        self.humidity = None
+        self.pressure = None
+        self.error = None
+        self.acquired = None
+
+    def load_calibration(self):
+        chip_id = self.dev.read(BME280_REG_CHIP_ID, 1)[0]
+        if chip_id != BME280_CHIP_ID:
+            raise OSError(errno.ENODEV, f"no BME280 at 0x{self.dev.address:02x}, chip id 0x{chip_id:02x}")
+        tp = self.dev.read(BME280_REG_CALIB_TP, 26)
+        h = self.dev.read(BME280_REG_CALIB_H, 7)
+        self.calibration = BME280Calibration(tp, h)
+
+    def start(self, now):
+        """Trigger a forced measurement, loading the calibration the first time."""
+        self.error = None
+        if self.calibration is None:
+            self.load_calibration()
+        ctrl_meas = (BME280_OVERSAMPLING_X1 << 5) | (BME280_OVERSAMPLING_X1 << 2) | BME280_MODE_FORCED
+        # register/data pairs in one write: ctrl_hum only takes effect with ctrl_meas
+        self.dev.write(BME280_REG_CTRL_HUM, [BME280_OVERSAMPLING_X1, BME280_REG_CTRL_MEAS, ctrl_meas])
+        self.state = TEMPERATURE
+        self.due = now + self.measure_time
+
+    def poll(self, now):
+        if self.state in (IDLE, DONE) or now < self.due:
+            return self.state == DONE
+        d = self.dev.read(BME280_REG_DATA, 8)
+        adc_p = (d[0] << 12) | (d[1] << 4) | (d[2] >> 4)
+        adc_t = (d[3] << 12) | (d[4] << 4) | (d[5] >> 4)
+        adc_h = (d[6] << 8) | d[7]
+        if adc_t == BME280_SKIPPED:
+            # the sensor lost its settings, e.g. after a brown-out
+            self.calibration = None
+            raise OSError(errno.EIO, f"BME280 at 0x{self.dev.address:02x} skipped the measurement")
+        self.temperature, self.pressure, self.humidity = self.calibration.compensate(adc_t, adc_p, adc_h)
+        self.state = DONE
+        return True
+
+    def fail(self, exc):
+        self.error = exc
+        self.state = IDLE
+
+    def results(self):
+        return [self.temperature, self.humidity, self.pressure]
+
+def next_due(pending, channel, now):
+    """Pick the next driver to poll, preferring the selected channel.
+
+    Of the drivers that are already due, one on the currently selected
+    channel is served first to save a multiplexer switch.
+    """
+    due = [d for d in pending if d.due <= now]
+    for d in due:
+        if d.channel == channel:
+            return d
+    if due:
+        return due[0]
+    return min(pending, key=lambda p: p.due)
+
+def measure_all(drivers, select, clock=time.monotonic, sleep=time.sleep, bus=None):
+    """Run one measurement on every driver of a bus, interleaving the waits.
+
+    select(driver) is called before each bus transfer of a driver, e.g. to
+    switch the multiplexer channel. drivers should be ordered by channel.
+    bus, a context manager such as a BusArbiter handle, is held around each
+    channel selection and the transfers that follow it, not while waiting.
+    """
+    if bus is None:
+        bus = nullcontext()
+    pending = []
+    current = None
+    for d in drivers:
+        try:
+            with bus:
+                select(d)
+                current = d.channel
+                d.start(clock())
+            pending.append(d)
+        except OSError as e:
+            d.fail(e)
+
+    while pending:
+        d = next_due(pending, current, clock())
+        delay = d.due - clock()
+        if delay > 0:
+            sleep(delay)
+        try:
+            with bus:
+                select(d)
+                current = d.channel
+                done = d.poll(clock())
+            if done:
+                d.acquired = time.time_ns()
+                pending.remove(d)
+        except OSError as e:
+            d.fail(e)
+            pending.remove(d)
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+"""Simulate a fleet of fetchsensors nodes publishing to one MQTT broker.
+
+Every virtual node gets a synthetic sensor set built from the I2C_SENSORS
+and DS18B20 templates of --generate, produces drifting readings at its
+interval and publishes them through the real sensor_lines() and Publisher
+code, over its own MQTT connection. All node connections are driven from
+one selector loop, so the simulated nodes do not need a thread each.
+
+A subscriber on the topic measures end-to-end latency and drops; with the
+built-in LocalBroker the broker-side throughput is reported as well. The
+LocalBroker is a threading socketserver and does start one thread per
+connection; for thousands of nodes, --broker can point at a real broker
+instead.
+"""
+
+import argparse
+import heapq
+import random
+import resource
+import selectors
+import statistics
+import sys
+import threading
+import time
+from collections import deque
+import paho.mqtt.client as mqtt
+from .discovery import I2C_SENSORS, create_sensor_config, create_w1_sensor_config
+from .publisher import Publisher, compile_lines, sensor_lines
+from .readers import refineSensorConfig
+from .simulation import LocalBroker
+
+SIZES = [10, 100, 1000]
+TOPIC = 'fleet'
+# start value and step of the random walk of each measurand
+WALKS = {'temperature': (20.0, 0.05), 'humidity': (50.0, 0.2), 'pressure': (1000.0, 0.1)}
+CONNECT_TIMEOUT = 30.0
+DRAIN_TIMEOUT = 5.0
+
+def build_node_sensors(rng):
+    """Return the sensors of a virtual node: 1-3 I2C sensors and 1-3 DS18B20."""
+    sensors = []
+    for channel in range(rng.randint(1, 3)):
+        sensor_type = rng.choice(list(I2C_SENSORS))
+        sensors.append(create_sensor_config(sensor_type, 1, I2C_SENSORS[sensor_type]["address"], channel))
+    for _ in range(rng.randint(1, 3)):
+        sensors.append(create_w1_sensor_config(f"28-{rng.getrandbits(48):012x}"))
+    return refineSensorConfig(sensors)
+
+class VirtualNode:
+    def __init__(self, name, sensors, client, publisher, rng):
+        self.name = name
+        self.sensors = compile_lines(sensors, name)
+        self.client = client
+        self.publisher = publisher
+        self.rng = rng
+        for item in sensors:
+            for v in item['values']:
+                v['raw'] = WALKS[v['measurand']][0] + rng.uniform(-2, 2)
+
+    def cycle(self):
+        """Take synthetic readings and publish them like fetchsensors does."""
+        for item in self.sensors:
+            for v in item['values']:
+                v['raw'] += self.rng.gauss(0, WALKS[v['measurand']][1])
+            item['error'] = {}
+            item['timestamp'] = time.time_ns()
+        for item in self.sensors:
+            lines, _ = sensor_lines(item)
+            for msg in lines:
+                self.publisher.add(msg, item['timestamp'])
+        self.publisher.flush()
+
+class SentLog:
+    """Send times of payloads, looked up by the subscriber to get latencies."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sent = {}  # payload -> deque of send times
+        self.latencies = []
+        self.received = 0
+
+    def record(self, payload):
+        with self.lock:
+            self.sent.setdefault(payload.encode(), deque()).append(time.perf_counter())
+
+    def receive(self, payload):
+        now = time.perf_counter()
+        with self.lock:
+            self.received += 1
+            times = self.sent.get(payload)
+            if times:
+                self.latencies.append(now - times.popleft())
+                if not times:
+                    del self.sent[payload]
+
+class RecordingClient:
+    """Pass publishes through to a paho client, logging when each was sent."""
+
+    def __init__(self, client, log):
+        self.client = client
+        self.log = log
+
+    def is_connected(self):
+        return self.client.is_connected()
+
+    def publish(self, topic, payload, qos=0):
+        self.log.record(payload)
+        return self.client.publish(topic, payload, qos=qos)
+
+def pump(selector, clients, timeout):
+    """Run one iteration of the event loop of all clients."""
+    for key, _ in selector.select(timeout):
+        key.data.loop_read()
+    for client in clients:
+        if client.want_write():
+            client.loop_write()
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def run(count, duration, interval, host, port, batch, qos, broker, seed):
+    rng = random.Random(seed)
+    log = SentLog()
+    subscriber = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f"fleet-sub-{count}")
+    subscriber.on_message = lambda client, userdata, message: log.receive(message.payload)
+    subscriber.connect(host, port, 60)
+    subscriber.subscribe(TOPIC)
+    subscriber.loop_start()
+
+    selector = selectors.DefaultSelector()
+    nodes = []
+    for i in range(count):
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f"fleet-{count}-{i}")
+        client.connect(host, port, 60)
+        selector.register(client.socket(), selectors.EVENT_READ, client)
+        publisher = Publisher(RecordingClient(client, log), TOPIC, batch=batch, qos=qos)
+        nodes.append(VirtualNode(f"sim{i:05d}", build_node_sensors(rng), client, publisher, rng))
+    clients = [node.client for node in nodes]
+
+    deadline = time.monotonic() + CONNECT_TIMEOUT
+    while not all(c.is_connected() for c in clients) and time.monotonic() < deadline:
+        pump(selector, clients, 0.01)
+    connected = sum(c.is_connected() for c in clients)
+    while not subscriber.is_connected() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.1)  # let the SUBSCRIBE reach the broker
+
+    if broker is not None:
+        broker.reset()
+    start = time.monotonic()
+    end = start + duration
+    queue = [(start + rng.random() * interval, i) for i in range(count)]
+    heapq.heapify(queue)
+    next_misc = start + 1.0
+    while True:
+        now = time.monotonic()
+        if now >= end:
+            break
+        while queue and queue[0][0] <= now:
+            due, i = heapq.heappop(queue)
+            nodes[i].cycle()
+            heapq.heappush(queue, (due + interval, i))
+        if now >= next_misc:
+            for c in clients:
+                c.loop_misc()
+            next_misc = now + 1.0
+        pump(selector, clients, max(0.0, min(queue[0][0], end) - time.monotonic()))
+    elapsed = time.monotonic() - start
+
+    sent = sum(node.publisher.messages for node in nodes)
+    lines = sum(len(sensor_lines(item)[0]) for node in nodes for item in node.sensors)
+    drain_end = time.monotonic() + DRAIN_TIMEOUT
+    while log.received < sent and time.monotonic() < drain_end:
+        pump(selector, clients, 0.01)
+    broker_messages = broker.messages if broker is not None else None
+
+    for c in clients:
+        c.disconnect()
+    selector.close()
+    subscriber.loop_stop()
+    subscriber.disconnect()
+
+    return {
+        'nodes': count,
+        'connected': connected,
+        'lines_per_cycle': lines,
+        'sent': sent,
+        'received': log.received,
+        'drop': 1 - log.received / sent if sent else 0.0,
+        'broker_rate': broker_messages / elapsed if broker_messages is not None else None,
+        'rate': log.received / elapsed,
+        'p50': percentile(log.latencies, 0.5),
+        'p99': percentile(log.latencies, 0.99),
+        'max': max(log.latencies, default=0.0),
+        'mean': statistics.mean(log.latencies) if log.latencies else 0.0,
+    }
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate a fleet of fetchsensors nodes against one MQTT broker')
+    parser.add_argument('--nodes', type=int, nargs='+', default=SIZES, help='numbers of virtual nodes to simulate')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds to publish per fleet size')
+    parser.add_argument('--interval', type=float, default=1.0, help='seconds between the readings of a node')
+    parser.add_argument('--broker', help='host:port of an external broker, default is a local in-process broker')
+    parser.add_argument('--batch', action='store_true', help='publish one batch message per node and cycle')
+    parser.add_argument('--qos', type=int, default=0, choices=[0, 1], help='MQTT QoS of the published messages')
+    parser.add_argument('--seed', type=int, default=1, help='seed of the synthetic sensor sets and readings')
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    broker = None
+    if args.broker:
+        host, _, port = args.broker.partition(':')
+        port = int(port or 1883)
+    else:
+        broker = LocalBroker().start()
+        host, port = broker.host, broker.port
+
+    print(f"{'nodes':>6} {'conn':>6} {'lines':>6} {'sent':>8} {'recv':>8} {'drop':>6} "
+          f"{'broker/s':>9} {'recv/s':>8} {'p50 ms':>7} {'p99 ms':>7} {'max ms':>7}")
+    try:
+        for count in args.nodes:
+            r = run(count, args.duration, args.interval, host, port, args.batch, args.qos, broker, args.seed)
+            broker_rate = f"{r['broker_rate']:>9.0f}" if r['broker_rate'] is not None else f"{'-':>9}"
+            print(f"{r['nodes']:>6} {r['connected']:>6} {r['lines_per_cycle']:>6} {r['sent']:>8} "
+                  f"{r['received']:>8} {r['drop'] * 100:>5.1f}% {broker_rate} {r['rate']:>8.0f} "
+                  f"{r['p50'] * 1000:>7.1f} {r['p99'] * 1000:>7.1f} {r['max'] * 1000:>7.1f}")
+    finally:
+        if broker is not None:
+            broker.stop()
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"max RSS {rss} KiB", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
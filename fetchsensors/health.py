@@ -0,0 +1,77 @@
+"""Per-sensor health tracking for fetchsensors.
+
+A sensor that fails a number of reads in a row is backed off: instead of
+being retried at its interval, it is retried after a delay that doubles with
+every further failure, up to a maximum. The first successful read ends the
+backoff and the sensor returns to its normal schedule.
+
+Errors are published deduplicated: a sensor's error is published when it
+first occurs or changes, and a repeated identical error at most once per
+error_repeat seconds.
+"""
+
+import sys
+import time
+
+FAILURES = 3          # consecutive failed reads before backing off
+MAX_BACKOFF = 900     # seconds
+ERROR_REPEAT = 600    # seconds between publications of the same error
+# doublings of the interval are counted up to this, far past any max_backoff;
+# beyond about 1023 a float interval would overflow
+MAX_DOUBLINGS = 64
+
+class SensorHealth:
+    """Track consecutive failures and published errors of every sensor."""
+
+    def __init__(self, failures=FAILURES, max_backoff=MAX_BACKOFF, error_repeat=ERROR_REPEAT,
+                 clock=time.monotonic):
+        self.failures = failures
+        self.max_backoff = max_backoff
+        self.error_repeat = error_repeat
+        self.clock = clock
+        self.failed = {}    # id(sensor) -> consecutive failed reads
+        self.reported = {}  # id(sensor) -> (error type, error value, monotonic time published)
+        self.published = 0
+        self.suppressed = 0
+
+    @classmethod
+    def from_config(cls, config):
+        health = config.get('health', {})
+        return cls(health.get('failures', FAILURES), health.get('max_backoff', MAX_BACKOFF),
+                   health.get('error_repeat', ERROR_REPEAT))
+
+    def record(self, sensor, interval):
+        """Count the result of a read and return the backoff delay in seconds, 0 if none."""
+        key = id(sensor)
+        if not sensor['error']:
+            failed = self.failed.pop(key, 0)
+            self.reported.pop(key, None)
+            if failed >= self.failures:
+                print(f"INFO - {sensor['location']} recovered after {failed} failed reads")
+            return 0
+        failed = self.failed.get(key, 0) + 1
+        self.failed[key] = failed
+        if failed < self.failures:
+            return 0
+        doublings = min(failed - self.failures + 1, MAX_DOUBLINGS)
+        delay = min(interval * 2 ** doublings, max(self.max_backoff, interval))
+        print(f"WARN - {sensor['location']} failed {failed} reads in a row, retrying in {delay:g}s",
+              file=sys.stderr)
+        return delay
+
+    def report_error(self, sensor):
+        """Return True if the error of sensor should be published, counting the decision."""
+        now = self.clock()
+        key = id(sensor)
+        error_type, value = sensor['error']['type'], str(sensor['error']['value'])
+        last = self.reported.get(key)
+        if last is not None and last[:2] == (error_type, value) and now - last[2] < self.error_repeat:
+            self.suppressed += 1
+            return False
+        self.reported[key] = (error_type, value, now)
+        self.published += 1
+        return True
+
+    def backing_off(self):
+        """Return the number of sensors currently backed off."""
+        return sum(1 for failed in self.failed.values() if failed >= self.failures)
@@ -0,0 +1,215 @@
+"""In-process metrics of fetchsensors.
+
+Metrics collects read latency histograms per sensor and per bus, publish
+latency, publish queue depth, spool size and traffic, overruns and errors by
+type. They can be scraped in Prometheus text format from a small HTTP server
+on localhost and published to MQTT as Influx line protocol, so slow sensors
+and saturated buses can be found across all nodes.
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+METRICS_ADDRESS = '127.0.0.1'
+METRICS_INTERVAL = 60  # seconds between publications to MQTT
+
+def resident_bytes():
+    """Return the resident set size of this process."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(**labels):
+    return ','.join(f'{k}="{_label(v)}"' for k, v in labels.items())
+
+class Histogram:
+    """Cumulative-bucket histogram of durations in seconds, like Prometheus'."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def prometheus(self, name, labels=''):
+        sep = ',' if labels else ''
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+class Metrics:
+    """Metrics of one fetchsensors process; all methods are thread safe."""
+
+    def __init__(self, node):
+        self.node = node
+        self.lock = threading.Lock()
+        self.read_latency = {}   # (location, sensor, bus) -> Histogram
+        self.bus_latency = {}    # bus -> Histogram
+        self.publish_latency = Histogram()
+        self.errors = {}         # error type -> count
+        self.overruns = 0
+        self.queue_depth = 0
+        self.spool_bytes = 0
+        self.spooled = 0         # records written to the spool
+        self.replayed = 0        # records replayed from the spool
+        self.evicted = 0         # spool segments dropped while full, i.e. lost readings
+
+    def observe_read(self, sensor, bus, seconds):
+        key = (sensor['location'], sensor['sensor'], str(bus))
+        with self.lock:
+            self.read_latency.setdefault(key, Histogram()).observe(seconds)
+
+    def observe_bus(self, bus, seconds):
+        with self.lock:
+            self.bus_latency.setdefault(str(bus), Histogram()).observe(seconds)
+
+    def observe_publish(self, seconds):
+        with self.lock:
+            self.publish_latency.observe(seconds)
+
+    def count_error(self, error_type):
+        with self.lock:
+            self.errors[error_type] = self.errors.get(error_type, 0) + 1
+
+    def count_overruns(self, n=1):
+        with self.lock:
+            self.overruns += n
+
+    def set_queue(self, records, spool_bytes):
+        with self.lock:
+            self.queue_depth = records
+            self.spool_bytes = spool_bytes
+
+    def set_spool_totals(self, spooled, replayed, evicted):
+        with self.lock:
+            self.spooled = spooled
+            self.replayed = replayed
+            self.evicted = evicted
+
+    def prometheus(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            lines.append('# TYPE fetchsensors_read_seconds histogram')
+            for (location, sensor, bus), h in sorted(self.read_latency.items()):
+                lines += h.prometheus('fetchsensors_read_seconds',
+                                      _labels(node=self.node, location=location, sensor=sensor, bus=bus))
+            lines.append('# TYPE fetchsensors_bus_read_seconds histogram')
+            for bus, h in sorted(self.bus_latency.items()):
+                lines += h.prometheus('fetchsensors_bus_read_seconds', _labels(node=self.node, bus=bus))
+            lines.append('# TYPE fetchsensors_publish_seconds histogram')
+            lines += self.publish_latency.prometheus('fetchsensors_publish_seconds', _labels(node=self.node))
+            lines.append('# TYPE fetchsensors_errors_total counter')
+            for error_type, count in sorted(self.errors.items()):
+                lines.append(f'fetchsensors_errors_total{{{_labels(node=self.node, type=error_type)}}} {count}')
+            lines.append('# TYPE fetchsensors_overruns_total counter')
+            lines.append(f'fetchsensors_overruns_total{{{_labels(node=self.node)}}} {self.overruns}')
+            lines.append('# TYPE fetchsensors_publish_queue_records gauge')
+            lines.append(f'fetchsensors_publish_queue_records{{{_labels(node=self.node)}}} {self.queue_depth}')
+            lines.append('# TYPE fetchsensors_spool_bytes gauge')
+            lines.append(f'fetchsensors_spool_bytes{{{_labels(node=self.node)}}} {self.spool_bytes}')
+            lines.append('# TYPE fetchsensors_spooled_records_total counter')
+            lines.append(f'fetchsensors_spooled_records_total{{{_labels(node=self.node)}}} {self.spooled}')
+            lines.append('# TYPE fetchsensors_replayed_records_total counter')
+            lines.append(f'fetchsensors_replayed_records_total{{{_labels(node=self.node)}}} {self.replayed}')
+            lines.append('# TYPE fetchsensors_spool_evicted_segments_total counter')
+            lines.append(f'fetchsensors_spool_evicted_segments_total{{{_labels(node=self.node)}}} {self.evicted}')
+        lines.append('# TYPE process_resident_memory_bytes gauge')
+        lines.append(f'process_resident_memory_bytes {resident_bytes()}')
+        return '\n'.join(lines) + '\n'
+
+    def lines(self):
+        """Return a summary of the metrics as line-protocol records."""
+        node = self.node
+        lines = []
+        with self.lock:
+            for (location, sensor, bus), h in sorted(self.read_latency.items()):
+                lines.append(f"fetchsensors_read,location={location},node={node},sensor={sensor},bus={bus} "
+                             f"count={h.count}i,sum={h.sum:.6f}")
+            for bus, h in sorted(self.bus_latency.items()):
+                lines.append(f"fetchsensors_bus_read,node={node},bus={bus} count={h.count}i,sum={h.sum:.6f}")
+            for error_type, count in sorted(self.errors.items()):
+                lines.append(f"fetchsensors_errors,node={node},type={error_type} count={count}i")
+            p = self.publish_latency
+            lines.append(f"fetchsensors,node={node} overruns={self.overruns}i,publish_count={p.count}i,"
+                         f"publish_sum={p.sum:.6f},publish_queue={self.queue_depth}i,"
+                         f"spool_bytes={self.spool_bytes}i,spooled={self.spooled}i,replayed={self.replayed}i,"
+                         f"spool_evicted={self.evicted}i,rss_bytes={resident_bytes()}i")
+        return lines
+
+def _metrics_handler():
+    """Return the request handler class; http.server is only loaded when metrics are served."""
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = self.server.metrics.prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MetricsHandler
+
+class MetricsServer:
+    """Serve Metrics on http://address:port/metrics from a daemon thread."""
+
+    def __init__(self, metrics, port, address=METRICS_ADDRESS):
+        from http.server import ThreadingHTTPServer
+        self.server = ThreadingHTTPServer((address, port), _metrics_handler())
+        self.server.daemon_threads = True
+        self.server.metrics = metrics
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class MetricsPublisher:
+    """Publish the metrics summary to an MQTT topic every interval seconds."""
+
+    def __init__(self, client, topic, metrics, interval=METRICS_INTERVAL, clock=time.monotonic):
+        self.client = client
+        self.topic = topic
+        self.metrics = metrics
+        self.interval = interval
+        self.clock = clock
+        self.next = clock() + interval
+
+    def maybe_publish(self):
+        now = self.clock()
+        if now < self.next:
+            return
+        self.next = now + self.interval
+        if self.client.is_connected():
+            self.client.publish(self.topic, '\n'.join(self.metrics.lines()))
@@ -0,0 +1,60 @@
+"""TCA9548A multiplexer handling for fetchsensors.
+
+The multiplexer keeps its channel until it is told otherwise, so the selected
+channel is tracked and the control byte is only written when a sensor on a
+different channel is addressed.
+"""
+
+import time
+
+MUX_ADDRESS = 0x70
+# the TCA9548A connects the channel at the STOP of the control write
+MUX_SETTLE = 0.002
+
+class I2cMux:
+    """Channel selection with switch counters for one multiplexer."""
+
+    def __init__(self, bus, address=MUX_ADDRESS, settle=MUX_SETTLE):
+        self.bus = bus
+        self.address = address
+        self.settle = settle
+        self.current = None
+        self.switches = 0
+        self.skipped = 0
+        self.cycle_switches = 0
+        self.cycle_skipped = 0
+
+    def select(self, channel):
+        """Connect channel to the bus unless it is already selected."""
+        if channel == self.current:
+            self.skipped += 1
+            self.cycle_skipped += 1
+            return
+        try:
+            self.bus.write_byte(self.address, 1 << channel)
+        except OSError:
+            # the state of the mux is unknown now, force a write next time
+            self.current = None
+            raise
+        self.current = channel
+        self.switches += 1
+        self.cycle_switches += 1
+        if self.settle:
+            time.sleep(self.settle)
+
+    def disable(self):
+        """Disconnect all channels."""
+        self.current = None
+        self.bus.write_byte(self.address, 0)
+
+    def end_cycle(self):
+        """Return (switches, skipped) of the current cycle and reset them."""
+        counts = (self.cycle_switches, self.cycle_skipped)
+        self.cycle_switches = 0
+        self.cycle_skipped = 0
+        return counts
+
+def channel_key(sensor):
+    """Sort key that groups sensors by channel, unmultiplexed ones first."""
+    channel = sensor.get('channel')
+    return -1 if channel is None else channel
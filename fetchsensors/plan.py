@@ -0,0 +1,83 @@
+"""The sensor configuration of fetchsensors, compiled for the read loop.
+
+A SensorPlan holds everything the loop derives from sensors.json: the
+enabled sensors with their line-protocol tags rendered once, their readers
+and scheduler, deadband, aggregation and health tracking. The Collector
+keeps one plan and replaces it as a whole when the configuration file
+changes. The MQTT connection, spool and metrics outlive the plan.
+"""
+
+import json
+import os
+from .aggregate import Aggregator
+from .deadband import Deadband
+from .health import SensorHealth
+from .mux import MUX_SETTLE
+from .publisher import compile_lines
+from .readers import SensorReaders, checkSeconds, keepEnabledSensors, refineSensorConfig
+from .scheduler import AcquisitionScheduler
+
+RELOAD_CHECK = 5  # seconds between checks of the configuration file
+
+# sections that are only read at startup
+RESTART_SECTIONS = ('mqtt', 'spool', 'metrics')
+
+def read_config(config_file):
+    """Return the configuration and its enabled, refined sensors.
+
+    Raises OSError, json.JSONDecodeError, KeyError or ValueError for files
+    that cannot be used.
+    """
+    with open(config_file) as f:
+        config = json.load(f)
+    checkSeconds(config['interval'], 'interval')
+    return config, refineSensorConfig(keepEnabledSensors(config['sensors']))
+
+class ConfigWatcher:
+    """Tell whether a file has been modified or replaced since the last look."""
+
+    def __init__(self, path):
+        self.path = path
+        self.seen = self.identity()
+
+    def identity(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def changed(self):
+        identity = self.identity()
+        if identity is None or identity == self.seen:
+            return False
+        self.seen = identity
+        return True
+
+class SensorPlan:
+    """Readers, scheduler and filters of one sensor configuration."""
+
+    def __init__(self, config, sensors, arbiters=None, metrics=None):
+        self.config = config
+        self.node = config['node']
+        self.sensors = compile_lines(sensors, self.node)
+        self.scheduler = None
+        self.readers = SensorReaders(sensors, mux_settle=config.get('mux_settle', MUX_SETTLE), arbiters=arbiters,
+                                     w1_bulk=config.get('w1_bulk', True))
+        # a plan that fails half-way must not keep the buses it opened
+        try:
+            self.health = SensorHealth.from_config(config)
+            self.scheduler = AcquisitionScheduler(sensors, self.readers.read_sensor, self.readers.read_bus,
+                                                  config['interval'], metrics=metrics,
+                                                  read_w1=self.readers.read_w1 if self.readers.w1_bulk else None,
+                                                  health=self.health)
+            self.deadband = Deadband.from_config(config)
+            self.aggregator = Aggregator(sensors, config['interval'])
+        except:
+            self.close()
+            raise
+
+    def close(self):
+        if self.scheduler is not None:
+            self.scheduler.shutdown()
+        self.readers.close()
@@ -0,0 +1,179 @@
+"""MQTT publishing of line-protocol records for fetchsensors.
+
+In the default per-line mode every record is published as its own message,
+as soon as it is added. In batch mode the records of one cycle are collected,
+stamped with the time they were read and published as newline-separated
+Influx line protocol, split into messages of at most max_batch_bytes.
+
+Records that cannot be published because the broker is unreachable go to
+the spool, if one is configured, and are replayed at a limited rate once
+the client is connected again.
+"""
+
+import time
+
+# measurement and tags of a record, rendered once per value by compile_lines()
+TAGS = ("{},location={},node={},sensor={} ")
+PAYLOAD = ("value={:.2f}")
+ERRLOAD = ("type=\"{}\",value=\"{}\"")
+AGGLOAD = ("value={:.2f},min={:.2f},max={:.2f},count={}i")
+
+MAX_BATCH_BYTES = 16384
+REPLAY_RATE = 50  # records per second
+
+# paho.mqtt.client.MQTT_ERR_SUCCESS; paho is not imported here, so dry runs do not load it
+MQTT_ERR_SUCCESS = 0
+
+def compile_lines(sensors, node):
+    """Render the measurement and tags of every record of sensors once.
+
+    Each value gets its prefix in v['tags'], each sensor the prefix of its
+    error records in s['error_tags'].
+    """
+    for s in sensors:
+        s['error_tags'] = TAGS.format('error', s['location'], node, s['sensor'])
+        for v in s['values']:
+            v['tags'] = TAGS.format(v['measurand'], s['location'], node, s['sensor'])
+    return sensors
+
+def sensor_lines(item, deadband=None, aggregator=None):
+    """Return the line-protocol records of a sensor read and whether they are errors.
+
+    item must have been compiled by compile_lines(). With a Deadband, values
+    that have not changed enough are left out. With an Aggregator, windowed
+    values only yield a record when their window is complete; value is then
+    the mean of the window.
+    """
+    if item['error']:
+        return [item['error_tags'] + ERRLOAD.format(item['error']['type'], item['error']['value'])], True
+    lines = []
+    for v in item['values']:
+        if 'raw' not in v:
+            continue
+        if aggregator is not None and aggregator.windowed(v):
+            stats = aggregator.add(v, v['raw'])
+            if stats is not None:
+                mean, lo, hi, count = stats
+                c = v['correction']
+                lines.append(v['tags'] + AGGLOAD.format(mean+c, lo+c, hi+c, count))
+            continue
+        if deadband is not None and not deadband.report(v, v['raw']):
+            continue
+        lines.append(v['tags'] + PAYLOAD.format(v['raw']+v['correction']))
+    return lines, False
+
+def with_timestamp(line, timestamp_ns):
+    """Append an explicit nanosecond timestamp to a line-protocol record."""
+    return f"{line} {timestamp_ns}"
+
+def split_batches(lines, max_bytes):
+    """Group lines into batches whose joined payload is at most max_bytes.
+
+    A single line longer than max_bytes is sent as a batch of its own.
+    """
+    batch = []
+    size = 0
+    for line in lines:
+        length = len(line.encode())
+        if batch and size + 1 + length > max_bytes:
+            yield batch
+            batch = []
+            size = 0
+        size += length + (1 if batch else 0)
+        batch.append(line)
+    if batch:
+        yield batch
+
+class Publisher:
+    def __init__(self, client, topic, batch=False, qos=0, max_batch_bytes=MAX_BATCH_BYTES,
+                 spool=None, replay_rate=REPLAY_RATE, metrics=None):
+        self.client = client
+        self.metrics = metrics
+        self.topic = topic
+        self.batch = batch
+        self.qos = qos
+        self.max_batch_bytes = max_batch_bytes
+        self.spool = spool
+        self.replay_rate = replay_rate
+        self.last_replay = time.monotonic()
+        self.pending = []
+        self.messages = 0
+        self.spooled = 0
+        self.replayed = 0
+
+    @classmethod
+    def from_config(cls, client, mqtt_config, spool=None, replay_rate=REPLAY_RATE, metrics=None):
+        return cls(client, mqtt_config['topic'],
+                   batch=mqtt_config.get('batch', False),
+                   qos=mqtt_config.get('qos', 0),
+                   max_batch_bytes=mqtt_config.get('max_batch_bytes', MAX_BATCH_BYTES),
+                   spool=spool, replay_rate=replay_rate, metrics=metrics)
+
+    def _publish(self, payload):
+        if not self.client.is_connected():
+            return False
+        start = time.monotonic()
+        rc = self.client.publish(self.topic, payload, qos=self.qos).rc
+        if self.metrics is not None:
+            self.metrics.observe_publish(time.monotonic() - start)
+        if rc != MQTT_ERR_SUCCESS:
+            return False
+        self.messages += 1
+        return True
+
+    def _publish_lines(self, lines):
+        """Publish records in batches, return the records that were not sent."""
+        if not self.batch:
+            return [line for line in lines if not self._publish(line)]
+        unsent = []
+        for batch in split_batches(lines, self.max_batch_bytes):
+            if unsent or not self._publish('\n'.join(batch)):
+                unsent.extend(batch)
+        return unsent
+
+    def _store(self, lines):
+        if self.spool is not None and lines:
+            self.spool.append(lines)
+            self.spooled += len(lines)
+
+    def add(self, line, timestamp_ns=None):
+        """Publish a record, or queue it for the next flush() in batch mode."""
+        if timestamp_ns is None:
+            timestamp_ns = time.time_ns()
+        if not self.batch:
+            if not self._publish(line):
+                self._store([with_timestamp(line, timestamp_ns)])
+            return
+        self.pending.append(with_timestamp(line, timestamp_ns))
+
+    def flush(self):
+        """Publish the records queued since the last flush, then replay the spool."""
+        if self.metrics is not None:
+            self.metrics.set_queue(len(self.pending), len(self.spool) if self.spool is not None else 0)
+        if self.pending:
+            self._store(self._publish_lines(self.pending))
+            self.pending = []
+        self.replay()
+        if self.metrics is not None and self.spool is not None:
+            self.metrics.set_spool_totals(self.spooled, self.replayed, self.spool.evicted)
+
+    def replay(self):
+        """Replay spooled records, at most replay_rate per second."""
+        now = time.monotonic()
+        budget = int((now - self.last_replay) * self.replay_rate)
+        if self.spool is None or not len(self.spool) or not self.client.is_connected():
+            self.last_replay = now
+            return
+        if budget < 1:
+            return
+        self.last_replay = now
+        while budget > 0:
+            lines, offset = self.spool.peek(budget)
+            if not lines:
+                break
+            if self._publish_lines(lines):
+                # connection lost again, retry from the same offset later
+                break
+            self.spool.consume(offset)
+            self.replayed += len(lines)
+            budget -= len(lines)
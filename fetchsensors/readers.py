@@ -0,0 +1,263 @@
+"""Sensor reading for fetchsensors.
+
+SensorReaders owns the I2C buses, multiplexers and drivers of the configured
+sensors and provides the read functions the AcquisitionScheduler calls. The
+bus and device factories and the 1-Wire sysfs directory can be replaced, which
+lets the benchmark run the real read path against simulated hardware.
+
+DS18B20 probes are read from the w1_therm 'temperature' attribute where the
+kernel provides it, and from 'w1_slave' otherwise. If the bus master offers
+'therm_bulk_read', read_w1() starts the conversion of all its probes with one
+command, which the kernel returns from once the slowest of them is done, and
+then collects the results, so a cycle costs one conversion time instead of
+one per probe. Probes it cannot convert this way are left to the scheduler
+to read in parallel.
+"""
+
+import os
+import sys
+import time
+from .drivers import HTU21Sensor, Si7021Sensor, BME280Sensor, SMBusDevice, open_device, measure_all
+from .drivers import SENSOR_SI7021, SENSOR_HTU21, SENSOR_BME280
+from .arbiter import PRIORITY_SENSOR
+from .mux import I2cMux, MUX_SETTLE
+from .scheduler import sensor_bus
+
+W1_DEVICES = '/sys/bus/w1/devices'
+
+# DS18B20 maximum conversion time in seconds by resolution in bits
+DS18B20_CONVERSION_TIMES = {9: 0.09375, 10: 0.1875, 11: 0.375, 12: 0.75}
+DS18B20_RESOLUTION = 12
+
+I2C_DRIVERS = {
+    SENSOR_SI7021: Si7021Sensor,
+    SENSOR_HTU21: HTU21Sensor,
+    SENSOR_BME280: BME280Sensor,
+}
+
+def keepEnabledSensors(sensors):
+    return list(filter(lambda s: s['enabled'] == 1, sensors))
+
+def checkSeconds(value, name):
+    """Raise ValueError unless value is a positive number of seconds."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        raise ValueError(f"{name} must be a positive number of seconds, not {value!r}")
+
+def refineSensorConfig(sensors):
+    for s in sensors:
+        s['i2c'] = s['sensor'] in I2C_DRIVERS
+        for key in ('interval', 'window'):
+            if key in s:
+                checkSeconds(s[key], f"{key} of {s['sensor']} {s['id']}")
+        for v in s['values']:
+            if 'window' in v:
+                checkSeconds(v['window'], f"window of {s['sensor']} {s['id']} {v['measurand']}")
+        if 'resolution' in s and s['resolution'] not in DS18B20_CONVERSION_TIMES:
+            raise ValueError(f"resolution of {s['sensor']} {s['id']} must be 9 to 12 bits, not {s['resolution']}")
+    return sensors
+
+def i2cBusNumbers(sensors):
+    return sorted({sensor_bus(item) for item in sensors if item['i2c']})
+
+def readDS18B20(sensor, w1_devices=W1_DEVICES):
+    device = w1_devices+'/'+sensor['id']
+    try:
+        if os.path.exists(device+'/temperature'):
+            # millidegrees; the kernel has already checked the CRC
+            with open(device+'/temperature') as file:
+                sensor['values'][0]['raw'] = int(file.read()) / 1000
+            sensor['error'] = {}
+        else:
+            file = open(device+'/w1_slave')
+            filecontent = file.read()
+            file.close()
+
+            if filecontent.split("\n")[0].strip()[-3:] != 'YES':
+                sensor['error'] = { 'type': 'SensorValueInvalid', 'value': '???' }
+                return
+            tp = filecontent.split("\n")[1].split(" ")[9]
+            sensor['values'][0]['raw'] = float(tp[2:]) / 1000
+            sensor['error'] = {}
+
+        if sensor['values'][0]['raw'] > 120 or sensor['values'][0]['raw'] < -40:
+            sensor['error'] = {
+                'type': 'SensorValueInvalid_2',
+                'value':  str(sensor['values'][0]['raw'])
+            }
+
+    except FileNotFoundError:
+        sensor['error'] = { 'type': 'SensorNotFound', 'value': 'DS18B20 ' + sensor['id'] }
+    except:
+        exc_type, exc_value, _1 = sys.exc_info()
+        sensor['error'] = { 'type': exc_type.__qualname__, 'value': exc_value }
+
+def w1_master(sensor, w1_devices=W1_DEVICES):
+    """Return the sysfs directory of the bus master of a 1-Wire device, None if it is gone."""
+    device = os.path.realpath(w1_devices+'/'+sensor['id'])
+    if not os.path.isdir(device):
+        return None
+    return os.path.dirname(device)
+
+def w1_converting(master):
+    """Return whether a bulk conversion on a bus master is still in progress."""
+    try:
+        with open(master+'/therm_bulk_read') as f:
+            return f.read().strip() == '-1'
+    except OSError:
+        return False
+
+def w1_trigger(master):
+    """Start the conversion of all probes on a bus master.
+
+    w1_therm only accepts the exact command "trigger\n"; anything else is
+    logged by the kernel but the write still succeeds.
+    """
+    with open(master+'/therm_bulk_read', 'w') as f:
+        f.write('trigger\n')
+
+def setDS18B20Resolution(sensor, w1_devices=W1_DEVICES):
+    """Write the configured resolution of a DS18B20 unless the probe already has it."""
+    path = w1_devices+'/'+sensor['id']+'/resolution'
+    resolution = str(sensor['resolution'])
+    with open(path) as f:
+        if f.read().strip() == resolution:
+            return
+    with open(path, 'w') as f:
+        f.write(resolution)
+
+# readers of the sensors that are not on an I2C bus, called as read(sensor, w1_devices)
+W1_READERS = {
+    'DS18B20': readDS18B20,
+}
+
+def open_smbus(bus_num):
+    import smbus
+    return smbus.SMBus(bus_num)
+
+class SensorReaders:
+    def __init__(self, sensors, bus_factory=open_smbus, device_factory=open_device,
+                 mux_settle=MUX_SETTLE, w1_devices=W1_DEVICES, arbiters=None, w1_bulk=True,
+                 w1_trigger=w1_trigger):
+        self.device_factory = device_factory
+        self.w1_devices = w1_devices
+        self.w1_trigger = w1_trigger
+        # bus number -> BusArbiter, for buses shared with other users in the process
+        self.arbiters = arbiters or {}
+        self.buses = {}
+        self.muxes = {}
+        self.drivers = {}
+        try:
+            for bus_num in i2cBusNumbers(sensors):
+                self.buses[bus_num] = bus_factory(bus_num)
+                self.muxes[bus_num] = I2cMux(self.buses[bus_num], settle=mux_settle)
+        except:
+            self.close()
+            raise
+
+        # id(sensor) -> reader of the sensors that are not on an I2C bus
+        self.w1_readers = {id(s): W1_READERS[s['sensor']] for s in sensors if s['sensor'] in W1_READERS}
+        # id(sensor) -> bus master directory, for the probes that can be bulk converted
+        self.w1_masters = {}
+        for s in sensors:
+            if s['sensor'] != 'DS18B20':
+                continue
+            if 'resolution' in s:
+                try:
+                    setDS18B20Resolution(s, w1_devices)
+                except OSError as e:
+                    print(f"ERROR - cannot set resolution of DS18B20 {s['id']}: {e}", file=sys.stderr)
+            master = w1_master(s, w1_devices) if w1_bulk else None
+            if master is not None and os.path.exists(master+'/therm_bulk_read'):
+                self.w1_masters[id(s)] = master
+        self.w1_bulk = bool(self.w1_masters)
+
+    def get_driver(self, sensor):
+        key = id(sensor)
+        if key not in self.drivers:
+            driver = I2C_DRIVERS[sensor['sensor']]
+            if driver.uses_smbus:
+                dev = SMBusDevice(self.buses[sensor_bus(sensor)], sensor['id'])
+            else:
+                dev = self.device_factory(sensor_bus(sensor), sensor['id'])
+            self.drivers[key] = driver(dev, sensor.get('channel'))
+        return self.drivers[key]
+
+    def read_bus(self, bus_num, items):
+        """Read all I2C sensors of a bus, interleaving their conversions."""
+        mux = self.muxes[bus_num]
+        drivers = []
+        for item in [item for item in items if item['i2c']]:
+            try:
+                drivers.append((item, self.get_driver(item)))
+            except OSError as e:
+                item['error'] = { 'type': type(e).__qualname__, 'value': e }
+                item['timestamp'] = time.time_ns()
+
+        def select(driver):
+            if driver.channel is not None:
+                mux.select(driver.channel)
+
+        arbiter = self.arbiters.get(bus_num)
+        measure_all([driver for _, driver in drivers], select,
+                    bus=arbiter.handle(PRIORITY_SENSOR) if arbiter is not None else None)
+
+        for item, driver in drivers:
+            if driver.error is None:
+                for v, raw in zip(item['values'], driver.results()):
+                    v['raw'] = raw
+                item['error'] = {}
+                item['timestamp'] = driver.acquired
+            else:
+                item['error'] = { 'type': type(driver.error).__qualname__, 'value': driver.error }
+                item['timestamp'] = time.time_ns()
+
+    def read_sensor(self, bus, item):
+        """Read a sensor that is not on an I2C bus."""
+        read = self.w1_readers.get(id(item))
+        if read is not None:
+            read(item, self.w1_devices)
+        else:
+            # ignore
+            item['error'] = {}
+        item['timestamp'] = time.time_ns()
+
+    def read_w1(self, bus, items):
+        """Read all due 1-Wire sensors, converting the probes of each bus master at once.
+
+        Return the probes that cannot be bulk converted, unread, so they can
+        be read individually.
+        """
+        masters = {}
+        single = []
+        for item in items:
+            master = self.w1_masters.get(id(item))
+            if master is None:
+                single.append(item)
+            else:
+                masters.setdefault(master, []).append(item)
+
+        # the trigger write returns once the kernel has waited the conversion
+        # time; a probe whose resolution could not be set may still be converting
+        deadline = time.monotonic() + DS18B20_CONVERSION_TIMES[DS18B20_RESOLUTION]
+        for master in list(masters):
+            try:
+                self.w1_trigger(master)
+            except OSError:
+                single += masters.pop(master)
+        for master in masters:
+            while w1_converting(master) and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        for group in masters.values():
+            for item in group:
+                readDS18B20(item, self.w1_devices)
+                item['timestamp'] = time.time_ns()
+        return single
+
+    def close(self):
+        for bus in self.buses.values():
+            bus.close()
+
+    def mux_stats(self):
+        """Return (bus, switches, skipped) of every multiplexer for the cycle."""
+        return [(bus_num, *mux.end_cycle()) for bus_num, mux in self.muxes.items()]
@@ -0,0 +1,185 @@
+"""Concurrent sensor acquisition for fetchsensors.
+
+1-Wire devices do not share any state with each other and are read in
+parallel, unless read_w1 is given, which reads all due 1-Wire devices at
+once, e.g. with a bulk conversion. Sensors on the same I2C bus share the bus
+and the multiplexer on it, so every bus gets a single worker that reads its
+sensors one after another.
+
+Every sensor has its own interval, by default the global one. The sensors are
+kept in a heap ordered by their next monotonic deadline; run_due() reads only
+the sensors whose deadline has passed, so slow-changing sensors do not cost a
+bus transfer every cycle. With a SensorHealth, sensors that keep failing are
+rescheduled after their backoff delay instead.
+"""
+
+import heapq
+import math
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .mux import channel_key
+
+W1_BUS = 'w1'
+DEFAULT_I2C_BUS = 1
+MAX_W1_WORKERS = 8
+
+def sensor_bus(sensor):
+    """Return the acquisition group of a sensor: an I2C bus number or W1_BUS."""
+    if sensor['i2c']:
+        return sensor.get('bus', DEFAULT_I2C_BUS)
+    return W1_BUS
+
+def sensor_interval(sensor, default):
+    """Return the sampling interval of a sensor in seconds."""
+    return sensor.get('interval', default)
+
+def group_by_bus(sensors):
+    """Group sensors by bus, I2C sensors ordered by multiplexer channel."""
+    groups = {}
+    for s in sensors:
+        groups.setdefault(sensor_bus(s), []).append(s)
+    for bus, group in groups.items():
+        if bus != W1_BUS:
+            group.sort(key=channel_key)
+    return groups
+
+class AcquisitionScheduler:
+    """Read sensors when they are due, overlapping independent buses.
+
+    read_sensor(bus, sensor) is called for every 1-Wire sensor and is expected
+    to store the readings in sensor['values'] and sensor['error'] like the
+    readXXX() functions do. read_bus(bus, sensors) reads the due sensors of
+    one I2C bus; by default it calls read_sensor for each of them in turn.
+    read_w1(W1_BUS, sensors), if given, reads all due 1-Wire sensors in one go
+    and returns those it could not read, which are then read in parallel with
+    read_sensor.
+    """
+
+    def __init__(self, sensors, read_sensor, read_bus=None, interval=None, clock=time.monotonic, metrics=None,
+                 read_w1=None, health=None):
+        self.read_sensor = read_sensor
+        self.read_bus = read_bus or self._read_serial
+        self.read_w1 = read_w1
+        self.health = health
+        self.metrics = metrics
+        self.sensors = sensors
+        self.clock = clock
+        self.groups = group_by_bus(sensors)
+        w1_count = len(self.groups.get(W1_BUS, []))
+        workers = len(self.groups) - (W1_BUS in self.groups) + min(w1_count, MAX_W1_WORKERS)
+        self.pool = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='acquire')
+        self.intervals = [sensor_interval(s, interval) for s in sensors]
+        self.restart()
+        self.last_cycle = 0.0
+        self.last_count = 0
+        self.missed = []
+        self.overruns = 0
+
+    def restart(self):
+        """Make every sensor due now, as if the scheduler had just been created."""
+        start = self.clock()
+        # (deadline, index, sensor); the index keeps entries with equal deadlines ordered
+        self.queue = [(start, i, s) for i, s in enumerate(self.sensors)]
+        heapq.heapify(self.queue)
+
+    def _read_serial(self, bus, sensors):
+        for s in sensors:
+            self.read_sensor(bus, s)
+
+    def _timed(self, read, bus, arg, group):
+        """Call read(bus, arg) and record the latency of the bus and its sensors."""
+        start_ns = time.time_ns()
+        start = time.monotonic()
+        unread = read(bus, arg) or []
+        if bus != W1_BUS:
+            self.metrics.observe_bus(bus, time.monotonic() - start)
+        skip = {id(s) for s in unread}
+        for s in group:
+            if id(s) not in skip:
+                self.metrics.observe_read(s, bus, (s.get('timestamp', start_ns) - start_ns) / 1e9)
+        return unread
+
+    def _submit_bus(self, bus, group):
+        if self.metrics is None:
+            return self.pool.submit(self.read_bus, bus, group)
+        return self.pool.submit(self._timed, self.read_bus, bus, group, group)
+
+    def _submit_sensor(self, s):
+        if self.metrics is None:
+            return self.pool.submit(self.read_sensor, W1_BUS, s)
+        return self.pool.submit(self._timed, self.read_sensor, W1_BUS, s, [s])
+
+    def _submit_w1(self, group):
+        if self.metrics is None:
+            return self.pool.submit(self.read_w1, W1_BUS, group)
+        return self.pool.submit(self._timed, self.read_w1, W1_BUS, group, group)
+
+    def _read(self, sensors):
+        start = self.clock()
+        futures = []
+        bulk = None
+        for bus, group in group_by_bus(sensors).items():
+            if bus == W1_BUS and self.read_w1 is not None:
+                bulk = self._submit_w1(group)
+            elif bus == W1_BUS:
+                futures += [self._submit_sensor(s) for s in group]
+            else:
+                futures.append(self._submit_bus(bus, group))
+        if bulk is not None:
+            futures += [self._submit_sensor(s) for s in bulk.result()]
+        for f in futures:
+            f.result()
+        self.last_cycle = self.clock() - start
+        self.last_count = len(sensors)
+        return self.last_cycle
+
+    def run_cycle(self):
+        """Read every sensor once and return the cycle duration in seconds."""
+        return self._read(self.sensors)
+
+    def run_due(self):
+        """Read the sensors whose deadline has passed and return them.
+
+        Each sensor is rescheduled one interval after its previous deadline.
+        A sensor that is late by a whole interval or more skips the readings
+        it missed instead of being read several times in a row. A sensor the
+        SensorHealth backs off is rescheduled its backoff delay after the read.
+        """
+        now = self.clock()
+        due = []
+        while self.queue and self.queue[0][0] <= now:
+            due.append(heapq.heappop(self.queue))
+        if not due:
+            return []
+        self._read([s for _, _, s in due])
+        end = self.clock()
+        self.missed = []
+        for deadline, i, s in due:
+            interval = self.intervals[i]
+            deadline += interval
+            delay = self.health.record(s, interval) if self.health is not None else 0
+            if delay:
+                deadline = end + delay
+            elif deadline <= end:
+                skipped = math.floor((end - deadline) / interval) + 1
+                deadline += skipped * interval
+                self.missed.append((s, skipped))
+            heapq.heappush(self.queue, (deadline, i, s))
+        return [s for _, _, s in due]
+
+    def next_deadline(self):
+        return self.queue[0][0] if self.queue else None
+
+    def report(self, log=True):
+        """Print how long the last read took, if log, and which sensors missed readings."""
+        if log:
+            print(f"read {self.last_count} sensors in {self.last_cycle:.3f}s")
+        for s, skipped in self.missed:
+            self.overruns += 1
+            if self.metrics is not None:
+                self.metrics.count_overruns()
+            print(f"WARN - {s['location']} missed {skipped} reading(s), overrun #{self.overruns}", file=sys.stderr)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
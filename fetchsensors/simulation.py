@@ -0,0 +1,391 @@
+"""Simulated hardware and broker for running fetchsensors without a Raspberry Pi.
+
+FakeSMBus and FakeI2cDevice stand in for smbus.SMBus and htu21.rawi2c.I2C,
+with a configurable latency per bus transaction and the datasheet conversion
+times of the HTU21 and Si7021, and FakeBME280 answers the register reads
+and writes of a BME280 in forced mode. FakeW1Tree writes a 1-Wire sysfs tree with
+DS18B20 w1_slave files. LocalBroker is a minimal MQTT 3.1.1 broker that
+accepts publishes and subscriptions on localhost.
+"""
+
+import errno
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from .drivers import SENSOR_SI7021, SENSOR_HTU21, SENSOR_BME280, CMD_MEASURE_RH_NO_HOLD, CMD_MEASURE_TEMP_NO_HOLD
+from .drivers import CMD_READ_TEMP_FROM_RH, BME280_CHIP_ID, BME280_REG_CHIP_ID, BME280_REG_CALIB_TP
+from .drivers import BME280_REG_CALIB_H, BME280_REG_CTRL_HUM, BME280_REG_CTRL_MEAS, BME280_REG_DATA
+from .mux import MUX_ADDRESS
+
+TRANSACTION_LATENCY = 0.0002  # about 2 bytes at 100 kHz
+DS18B20_CONVERSION = 0.75
+
+# typical conversion times, shorter than the maxima the drivers wait for
+CONVERSION_TIMES = {
+    SENSOR_HTU21: {CMD_MEASURE_RH_NO_HOLD: 0.014, CMD_MEASURE_TEMP_NO_HOLD: 0.044},
+    SENSOR_SI7021: {CMD_MEASURE_RH_NO_HOLD: 0.018, CMD_MEASURE_TEMP_NO_HOLD: 0.007},
+}
+
+def raw_temperature(celsius):
+    return int((celsius + 46.85) * 65536 / 175.72) & 0xFFFC
+
+def raw_humidity(rh):
+    return int((rh + 6) * 65536 / 125) & 0xFFFC
+
+class FakeSensor:
+    """State of a simulated HTU21/Si7021."""
+
+    def __init__(self, sensor_type, temperature=21.5, humidity=45.0):
+        self.sensor_type = sensor_type
+        self.temperature = temperature
+        self.humidity = humidity
+        self.command = None
+        self.started = 0.0
+
+    def ready(self, now):
+        return now - self.started >= CONVERSION_TIMES[self.sensor_type].get(self.command, 0)
+
+    def result(self):
+        if self.command == CMD_MEASURE_RH_NO_HOLD:
+            return raw_humidity(self.humidity)
+        return raw_temperature(self.temperature)
+
+# trim parameters and raw readings of the datasheet's example device
+BME280_CALIB_TP = struct.pack('<HhhHhhhhhhhhBB', 27504, 26435, -1000, 36477, -10685, 3024,
+                              2855, 140, -7, 15500, -14600, 6000, 0, 75)
+BME280_CALIB_H = bytes([0x6a, 0x01, 0x00, 0x13, 0x29, 0x03, 0x1e])  # H2=362 H3=0 H4=313 H5=50 H6=30
+BME280_ADC_T = 519888   # 25.08 °C
+BME280_ADC_P = 415148   # 1006.53 hPa
+BME280_ADC_H = 30000
+BME280_CONVERSION = 0.008
+
+class FakeBME280:
+    """Registers of a simulated BME280."""
+
+    sensor_type = SENSOR_BME280
+
+    def __init__(self):
+        self.registers = bytearray(256)
+        self.registers[BME280_REG_CHIP_ID] = BME280_CHIP_ID
+        self.registers[BME280_REG_CALIB_TP:BME280_REG_CALIB_TP + 26] = BME280_CALIB_TP
+        self.registers[BME280_REG_CALIB_H:BME280_REG_CALIB_H + 7] = BME280_CALIB_H
+        # skipped values until the first measurement, as after power-on
+        self.registers[BME280_REG_DATA:BME280_REG_DATA + 8] = bytes([0x80, 0, 0, 0x80, 0, 0, 0x80, 0])
+        self.started = None
+
+    def write(self, register, data):
+        pairs = [register] + list(data)
+        for reg, value in zip(pairs[::2], pairs[1::2]):
+            self.registers[reg] = value
+            if reg == BME280_REG_CTRL_MEAS and value & 3 == 1 and self.registers[BME280_REG_CTRL_HUM]:
+                self.started = time.monotonic()
+
+    def read(self, register, length):
+        if self.started is not None and time.monotonic() - self.started >= BME280_CONVERSION:
+            p, t, h = BME280_ADC_P, BME280_ADC_T, BME280_ADC_H
+            self.registers[BME280_REG_DATA:BME280_REG_DATA + 8] = bytes(
+                [p >> 12, (p >> 4) & 0xFF, (p & 0xF) << 4, t >> 12, (t >> 4) & 0xFF, (t & 0xF) << 4, h >> 8, h & 0xFF])
+            self.started = None
+        return list(self.registers[register:register + length])
+
+class FakeSMBus:
+    """An I2C bus with an optional TCA9548A and simulated sensors.
+
+    sensors maps (channel, address) to a FakeSensor, channel None meaning
+    directly on the bus. Every transaction takes latency seconds, during
+    which the bus is locked; the total is kept in busy.
+    """
+
+    def __init__(self, bus_num, sensors=None, latency=TRANSACTION_LATENCY, mux=True):
+        self.bus_num = bus_num
+        self.sensors = sensors or {}
+        self.latency = latency
+        self.mux = mux
+        self.channels = 0
+        self.lock = threading.Lock()
+        self.busy = 0.0
+        self.transactions = 0
+
+    def transaction(self):
+        with self.lock:
+            start = time.perf_counter()
+            if self.latency:
+                time.sleep(self.latency)
+            self.busy += time.perf_counter() - start
+            self.transactions += 1
+
+    def sensor(self, address):
+        """Return the sensor that answers at address with the current channels."""
+        if (None, address) in self.sensors:
+            return self.sensors[(None, address)]
+        for channel in range(8):
+            if self.channels & (1 << channel) and (channel, address) in self.sensors:
+                return self.sensors[(channel, address)]
+        return None
+
+    def nack(self, address):
+        return OSError(errno.EREMOTEIO, f"no ACK from 0x{address:02x} on bus {self.bus_num}")
+
+    def write_byte(self, address, value):
+        self.transaction()
+        if self.mux and address == MUX_ADDRESS:
+            self.channels = value
+        elif self.sensor(address) is None:
+            raise self.nack(address)
+
+    def write_quick(self, address):
+        self.transaction()
+        if not (self.mux and address == MUX_ADDRESS) and self.sensor(address) is None:
+            raise self.nack(address)
+
+    def read_byte(self, address):
+        self.write_quick(address)
+        return 0
+
+    def write_i2c_block_data(self, address, register, data):
+        self.write_quick(address)
+        sensor = self.sensor(address)
+        if isinstance(sensor, FakeBME280):
+            sensor.write(register, data)
+
+    def read_i2c_block_data(self, address, register, length):
+        self.write_quick(address)
+        sensor = self.sensor(address)
+        if isinstance(sensor, FakeBME280):
+            return sensor.read(register, length)
+        return [0] * length
+
+    def close(self):
+        pass
+
+class FakeI2cDevice:
+    """htu21.rawi2c.I2C lookalike talking to the sensors of a FakeSMBus."""
+
+    def __init__(self, bus, address):
+        self.bus = bus
+        self.address = address
+        self.register = None
+
+    def write(self, command):
+        self.bus.transaction()
+        sensor = self.bus.sensor(self.address)
+        if sensor is None:
+            raise self.bus.nack(self.address)
+        if command == CMD_READ_TEMP_FROM_RH:
+            self.register = raw_temperature(sensor.temperature)
+        else:
+            sensor.command = command
+            sensor.started = time.monotonic()
+            self.register = None
+
+    def read_int(self, num_bytes=1, big_endian=True, crc8=False):
+        self.bus.transaction()
+        sensor = self.bus.sensor(self.address)
+        if sensor is None:
+            raise self.bus.nack(self.address)
+        if self.register is not None:
+            return self.register
+        if not sensor.ready(time.monotonic()):
+            raise self.bus.nack(self.address)
+        return sensor.result()
+
+class FakeW1Tree:
+    """A directory laid out like /sys/bus/w1/devices with DS18B20 probes.
+
+    As in sysfs, the device entries link to directories below their bus
+    master, which has a therm_bulk_read attribute. Being plain files, the
+    attributes do not convert anything: a bulk read finds the conversion
+    already done. wrap_trigger() checks the command written to start it and
+    blocks for the conversion time, as the kernel does.
+    """
+
+    def __init__(self, directory, ids, temperature=18.25, conversion_time=DS18B20_CONVERSION,
+                 master='w1_bus_master1'):
+        self.directory = directory
+        self.conversion_time = conversion_time
+        self.bulk_reads = 0
+        self.master = os.path.join(directory, master)
+        os.makedirs(self.master, exist_ok=True)
+        with open(os.path.join(self.master, 'therm_bulk_read'), 'w') as f:
+            f.write('0\n')
+        for device_id in ids:
+            os.makedirs(os.path.join(self.master, device_id), exist_ok=True)
+            link = os.path.join(directory, device_id)
+            if not os.path.islink(link):
+                os.symlink(os.path.join(master, device_id), link)
+            with open(os.path.join(self.master, device_id, 'resolution'), 'w') as f:
+                f.write('12\n')
+            self.set_temperature(device_id, temperature)
+
+    def set_temperature(self, device_id, celsius):
+        millis = int(celsius * 1000)
+        raw = (millis * 16 // 1000) & 0xFFFF
+        data = f"{raw & 0xFF:02x} {raw >> 8:02x} 4b 46 7f ff 0c 10 1c"
+        with open(os.path.join(self.master, device_id, 'w1_slave'), 'w') as f:
+            f.write(f"{data} : crc=1c YES\n{data} t={millis}\n")
+        with open(os.path.join(self.master, device_id, 'temperature'), 'w') as f:
+            f.write(f"{millis}\n")
+
+    def wrap(self, read_sensor):
+        """Add the DS18B20 conversion time the kernel spends in a read."""
+        def read(bus, item):
+            time.sleep(self.conversion_time)
+            read_sensor(bus, item)
+        return read
+
+    def wrap_trigger(self, trigger):
+        """Reject bulk read commands that w1_therm would ignore."""
+        def run(master):
+            trigger(master)
+            path = os.path.join(master, 'therm_bulk_read')
+            with open(path) as f:
+                command = f.read()
+            with open(path, 'w') as f:
+                f.write('0\n')
+            if command != 'trigger\n':
+                raise ValueError(f"w1_therm ignores {command!r} written to therm_bulk_read")
+            time.sleep(self.conversion_time)
+            self.bulk_reads += 1
+        return run
+
+class _MqttHandler(socketserver.BaseRequestHandler):
+    def _read_exact(self, n):
+        data = b''
+        while len(data) < n:
+            chunk = self.request.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError
+            data += chunk
+        return data
+
+    def _read_packet(self):
+        header = self._read_exact(1)[0]
+        length = 0
+        shift = 0
+        while True:
+            byte = self._read_exact(1)[0]
+            length |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        return header, self._read_exact(length)
+
+    def handle(self):
+        broker = self.server.broker
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            while True:
+                header, body = self._read_packet()
+                kind = header >> 4
+                if kind == 1:    # CONNECT
+                    self.request.sendall(b'\x20\x02\x00\x00')
+                elif kind == 3:  # PUBLISH
+                    qos = (header >> 1) & 3
+                    topic_len = struct.unpack('!H', body[:2])[0]
+                    topic = body[2:2 + topic_len].decode()
+                    pos = 2 + topic_len
+                    if qos:
+                        self.request.sendall(b'\x40\x02' + body[pos:pos + 2])
+                        pos += 2
+                    broker.received(topic, body[pos:])
+                elif kind == 8:  # SUBSCRIBE
+                    packet_id = body[:2]
+                    topic_len = struct.unpack('!H', body[2:4])[0]
+                    broker.subscribe(body[4:4 + topic_len].decode(), self.request)
+                    self.request.sendall(b'\x90\x03' + packet_id + b'\x00')
+                elif kind == 12:  # PINGREQ
+                    self.request.sendall(b'\xd0\x00')
+                elif kind == 14:  # DISCONNECT
+                    break
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            broker.unsubscribe(self.request)
+
+class _Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024  # fleet simulations connect thousands of clients at once
+
+def _encode_length(n):
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        out.append(byte | (0x80 if n else 0))
+        if not n:
+            return bytes(out)
+
+class LocalBroker:
+    """Minimal MQTT 3.1.1 broker on localhost for benchmarks and simulations.
+
+    Counts the messages and payload bytes it receives and forwards them,
+    at QoS 0, to clients subscribed to exactly that topic (or '#').
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.server = _Server((host, port), _MqttHandler)
+        self.server.broker = self
+        self.host, self.port = self.server.server_address
+        self.lock = threading.Lock()
+        self.messages = 0
+        self.bytes = 0
+        self.subscribers = {}
+        self.send_locks = {}  # conn -> lock, publishers of several connections forward to it
+        self.on_message = None
+        self.thread = threading.Thread(target=self.server.serve_forever, name='broker', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def subscribe(self, topic, conn):
+        with self.lock:
+            self.subscribers.setdefault(topic, []).append(conn)
+            self.send_locks.setdefault(conn, threading.Lock())
+
+    def unsubscribe(self, conn):
+        with self.lock:
+            for conns in self.subscribers.values():
+                if conn in conns:
+                    conns.remove(conn)
+            self.send_locks.pop(conn, None)
+
+    def received(self, topic, payload):
+        with self.lock:
+            self.messages += 1
+            self.bytes += len(payload)
+            targets = [(conn, self.send_locks[conn])
+                       for conn in self.subscribers.get(topic, []) + self.subscribers.get('#', [])]
+        if self.on_message is not None:
+            self.on_message(topic, payload)
+        if targets:
+            body = struct.pack('!H', len(topic)) + topic.encode() + payload
+            packet = b'\x30' + _encode_length(len(body)) + body
+            for conn, lock in targets:
+                try:
+                    with lock:
+                        conn.sendall(packet)
+                except OSError:
+                    pass
+
+    def reset(self):
+        with self.lock:
+            self.messages = 0
+            self.bytes = 0
+
+    def wait_for(self, messages, timeout=5.0):
+        """Wait until at least messages were received, return True if so."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.messages >= messages:
+                return True
+            time.sleep(0.001)
+        return self.messages >= messages
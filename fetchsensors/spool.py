@@ -0,0 +1,120 @@
+"""Store-and-forward spool for unsent line-protocol records.
+
+Records that cannot be published are appended to segment files in a spool
+directory. Segments are only ever appended to and deleted as a whole, so the
+SD card never sees the same blocks rewritten. Once the byte budget is used up
+the oldest segments are evicted. Every record carries its own timestamp, so a
+record that is replayed twice after a restart just overwrites the same point
+in InfluxDB.
+"""
+
+import os
+import sys
+
+SPOOL_DIR = '/var/lib/fetchsensors/spool'
+MAX_BYTES = 16 * 1024 * 1024
+SEGMENT_BYTES = 1024 * 1024
+SEGMENT_SUFFIX = '.seg'
+
+class Spool:
+    def __init__(self, directory=SPOOL_DIR, max_bytes=MAX_BYTES, segment_bytes=SEGMENT_BYTES):
+        self.directory = directory
+        self.max_bytes = max(max_bytes, 2 * segment_bytes)
+        self.segment_bytes = segment_bytes
+        self.evicted = 0
+        os.makedirs(directory, exist_ok=True)
+        self.segments = sorted(
+            int(name[:-len(SEGMENT_SUFFIX)])
+            for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX)
+        )
+        self.size = sum(os.path.getsize(self._path(seq)) for seq in self.segments)
+        self.writer = None
+        self.read_offset = 0
+
+    @classmethod
+    def from_config(cls, spool_config):
+        return cls(spool_config.get('dir', SPOOL_DIR),
+                   max_bytes=spool_config.get('max_bytes', MAX_BYTES),
+                   segment_bytes=spool_config.get('segment_bytes', SEGMENT_BYTES))
+
+    def _path(self, seq):
+        return os.path.join(self.directory, f"{seq:010d}{SEGMENT_SUFFIX}")
+
+    def __len__(self):
+        """Number of bytes waiting to be replayed."""
+        return self.size - self.read_offset
+
+    def _open_writer(self):
+        # always start a new segment, the last one may end in a partial record
+        seq = self.segments[-1] + 1 if self.segments else 0
+        self.segments.append(seq)
+        self.writer = open(self._path(seq), 'ab')
+
+    def _close_writer(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def _drop_head(self):
+        if self.segments[0] == self._writer_seq():
+            self._close_writer()
+        seq = self.segments.pop(0)
+        path = self._path(seq)
+        self.size -= os.path.getsize(path)
+        os.remove(path)
+        self.read_offset = 0
+
+    def append(self, lines):
+        """Append records with a single write to the current segment."""
+        if not lines:
+            return
+        data = ('\n'.join(lines) + '\n').encode()
+        if self.writer is None or self.writer.tell() >= self.segment_bytes:
+            self._close_writer()
+            self._open_writer()
+        self.writer.write(data)
+        self.writer.flush()
+        self.size += len(data)
+        while self.size > self.max_bytes and len(self.segments) > 1:
+            self.evicted += 1
+            print(f"WARN - spool full, evicting segment {self.segments[0]}", file=sys.stderr)
+            self._drop_head()
+
+    def _read_head(self, max_records):
+        lines = []
+        offset = self.read_offset
+        complete = len(self.segments) > 1 or self.writer is None
+        with open(self._path(self.segments[0]), 'rb') as f:
+            f.seek(offset)
+            while len(lines) < max_records:
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    # skip a record cut short by a crash, once nothing follows it
+                    if line and complete:
+                        offset += len(line)
+                    break
+                offset += len(line)
+                lines.append(line[:-1].decode())
+        return lines, offset
+
+    def peek(self, max_records):
+        """Return up to max_records of the oldest records and their end offset."""
+        while self.segments:
+            lines, offset = self._read_head(max_records)
+            if lines or self.segments[0] == self._writer_seq():
+                return lines, offset
+            self._drop_head()
+        return [], 0
+
+    def _writer_seq(self):
+        return self.segments[-1] if self.writer is not None else None
+
+    def consume(self, offset):
+        """Mark the records up to offset of the oldest segment as sent."""
+        self.read_offset = offset
+        head = self._path(self.segments[0])
+        if offset >= os.path.getsize(head):
+            self._drop_head()
+
+    def close(self):
+        self._close_writer()
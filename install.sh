@@ -59,8 +59,7 @@ apt-get install -y \
     liblcms2-dev \
     libopenjp2-7 \
     libtiff6 \
-    curl \
-    jq
+    curl
 
 # Install uv if not already available
 if ! command -v uv &>/dev/null; then
@@ -81,6 +80,10 @@ find "$INSTALL_DIR" -name "*.py" -exec chmod 755 {} +
 # Configure and install services
 print_status "Configuring systemd services..."
 SERVICES=("updateoled" "fetchsensors")
+read -p "Run sensors and display in one process (raspistatus) instead? [y/N]: " combined
+if [[ ${combined:-N} =~ ^[Yy] ]]; then
+    SERVICES=("raspistatus")
+fi
 
 for service in "${SERVICES[@]}"; do
     read -p "Install $service service? [Y/n]: " install_service
@@ -130,7 +133,7 @@ echo "  Status: sudo systemctl status <service>"
 echo "  Logs:   sudo journalctl -u <service> -f"
 echo
 echo "Available services:"
-for service in "${SERVICES[@]}"; do
+for service in "updateoled" "fetchsensors" "raspistatus"; do
     if [ -f "/etc/systemd/system/$service.service" ]; then
         echo "  - $service.service"
     fi
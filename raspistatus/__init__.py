@@ -0,0 +1 @@
+"""fetchsensors and updateoled in one process."""
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""Benchmark the startup time of the raspi-status entry points.
+
+Imports every entry module in a fresh interpreter with -X importtime and
+reports the median time of the import itself and of the whole process, and
+which of the heavy hardware, display and network libraries the import
+pulled in. Those should only be loaded once a configured sensor or feature
+needs them, so any listed here slow down every service start and
+`fetchsensors --generate`.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+ENTRY_MODULES = [
+    'fetchsensors.fetchsensors',
+    'updateoled.updateoled',
+    'raspistatus.raspistatus',
+]
+
+# libraries that must not be loaded just by importing an entry module
+HEAVY_MODULES = [
+    'paho', 'smbus', 'htu21', 'board', 'busio', 'adafruit_ssd1306',
+    'http.server', 'urllib.request', 'pytz', 'dateutil',
+]
+
+def parse_importtime(stderr, module):
+    """Return the cumulative import time of module in seconds and all modules imported.
+
+    stderr is the output of -X importtime: one line per module with its self
+    and cumulative time in microseconds, nested imports indented.
+    """
+    cumulative = None
+    imported = set()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2].strip()
+        imported.add(name)
+        if name == module:
+            cumulative = int(fields[1]) / 1e6
+    return cumulative, imported
+
+def measure(module, python=sys.executable):
+    """Import module in a new interpreter, return (import s, process s, imported modules)."""
+    start = time.perf_counter()
+    result = subprocess.run([python, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr.strip().splitlines()[-1]}")
+    cumulative, imported = parse_importtime(result.stderr, module)
+    return cumulative, elapsed, imported
+
+def heavy(imported):
+    return [m for m in HEAVY_MODULES if m in imported]
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the import time of the raspi-status entry points')
+    parser.add_argument('--modules', nargs='+', default=ENTRY_MODULES, help='modules to import')
+    parser.add_argument('--runs', type=int, default=5, help='imports per module')
+    args = parser.parse_args()
+
+    print(f"{'module':<28} {'import ms':>9} {'process ms':>10}  heavy libraries")
+    failed = False
+    for module in args.modules:
+        try:
+            runs = [measure(module) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            failed = True
+            continue
+        imports = statistics.median(r[0] for r in runs)
+        processes = statistics.median(r[1] for r in runs)
+        print(f"{module:<28} {imports * 1000:>9.1f} {processes * 1000:>10.1f}  "
+              f"{', '.join(heavy(runs[0][2])) or '-'}")
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
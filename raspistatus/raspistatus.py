@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""Run fetchsensors and updateoled in one process.
+
+The sensor loop and the display loop run as asyncio tasks. Their blocking
+I2C work is done in threads, and on the display's bus every transfer goes
+through one BusArbiter, so OLED frames can no longer land between a
+multiplexer switch and the sensor transfer that follows it. When both want
+the bus, sensor reads go first. Sensor values reach the display directly,
+without a second MQTT connection, and both loops share one interpreter and
+one copy of the libraries.
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from fetchsensors.arbiter import BusArbiter, PRIORITY_DISPLAY
+from fetchsensors.collector import Collector, printErr
+from fetchsensors.plan import read_config
+from updateoled.feed import SensorValues
+from updateoled.renderer import DirtyRenderer
+from updateoled.screen import StatusScreen
+from updateoled.sysinfo import SystemMetrics
+from updateoled.updateoled import start_gateway, open_display, STATS_EVERY, FRAME_INTERVAL
+
+DISPLAY_BUS = 1  # board.SCL and board.SDA
+
+async def collect(collector):
+    """Read and publish the sensors whenever one is due."""
+    while True:
+        await asyncio.to_thread(collector.step)
+        deadline = collector.next_deadline()
+        if deadline is None:
+            return
+        await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+
+async def refresh(renderer, screen, arbiter, interval=FRAME_INTERVAL):
+    """Redraw the display once per interval."""
+    while True:
+        try:
+            await asyncio.to_thread(renderer.show, screen.render())
+            if renderer.frames % STATS_EVERY == 0:
+                print(renderer.stats(), file=sys.stderr, flush=True)
+                print(screen.stats(), file=sys.stderr, flush=True)
+                print(arbiter.stats(), file=sys.stderr, flush=True)
+        except Exception as e:
+            printErr(f"display: {e!r}")
+        await asyncio.sleep(interval)
+
+async def run(collector, renderer, screen, arbiter, interval):
+    await asyncio.gather(collect(collector), refresh(renderer, screen, arbiter, interval))
+
+def main():
+    parser = argparse.ArgumentParser(description='Fetch and publish sensor values and show the status on the OLED display')
+    parser.add_argument('-c', help='use config file, default is /etc/sensors.json', default='/etc/sensors.json', metavar='config_file')
+    parser.add_argument('--dry', help='dry run - do not publish values', action='store_true')
+    args = parser.parse_args()
+
+    try:
+        config, sensors = read_config(args.c)
+    except Exception as e:
+        printErr(f'cannot read config file "{args.c}": {e}')
+        sys.exit(1)
+
+    # the display comes first: the collector starts threads and connections
+    # that only the finally clause below shuts down
+    arbiter = BusArbiter(f"i2c-{DISPLAY_BUS}")
+    disp = open_display()
+    renderer = DirtyRenderer(disp, arbiter.handle(PRIORITY_DISPLAY))
+    renderer.clear()
+    sysinfo = SystemMetrics()
+    gateway = start_gateway(config)
+    values = SensorValues()
+    screen = StatusScreen(disp.width, disp.height, config, values, gateway, sysinfo)
+    collector = Collector(config, sensors, args.dry, arbiters={DISPLAY_BUS: arbiter}, config_file=args.c,
+                          on_lines=lambda lines: values.update('\n'.join(lines)))
+
+    try:
+        asyncio.run(run(collector, renderer, screen, arbiter,
+                        config.get('display', {}).get('interval', FRAME_INTERVAL)))
+    except KeyboardInterrupt:
+        print("\nExiting gracefully...", file=sys.stderr, flush=True)
+    finally:
+        disp.fill(0)
+        with arbiter.handle(PRIORITY_DISPLAY):
+            disp.show()
+        sysinfo.close()
+        gateway.stop()
+        collector.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""Startup of the Collector with I2C sensors."""
+
+import contextlib
+import io
+import sys
+import time
+import types
+import unittest
+from unittest import mock
+
+from fetchsensors.collector import Collector
+from fetchsensors.readers import refineSensorConfig
+
+CONFIG = {
+    'node': 'test',
+    'interval': 1,
+    'sensors': [
+        {'enabled': 1, 'sensor': 'HTU21', 'id': '0x40', 'location': 'cellar', 'interval': 0.05,
+         'values': [{'measurand': 'temperature', 'correction': 0}]},
+    ],
+}
+
+class FakeBus:
+    def __init__(self, bus_num):
+        pass
+
+    def close(self):
+        pass
+
+class StartupTest(unittest.TestCase):
+    def test_settle_delay_is_no_overrun(self):
+        # a shorter settle delay that still spans several intervals
+        settle = time.sleep
+        with mock.patch.dict(sys.modules, {'smbus': types.SimpleNamespace(SMBus=FakeBus)}), \
+             mock.patch('time.sleep', lambda seconds: settle(0.2)):
+            collector = Collector(CONFIG, refineSensorConfig(CONFIG['sensors']), is_dry_run=True)
+            self.addCleanup(collector.close)
+            scheduler = collector.plan.scheduler
+            scheduler.read_bus = lambda bus, items: [item.update(error={}, timestamp=0) for item in items]
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                due = collector.step()
+        self.assertEqual(len(due), 1)
+        self.assertEqual(scheduler.overruns, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,19 @@
+"""Backoff of a sensor that keeps failing."""
+
+import contextlib
+import io
+import unittest
+
+from fetchsensors.health import SensorHealth
+
+class BackoffTest(unittest.TestCase):
+    def test_delay_stays_capped_for_a_long_dead_sensor(self):
+        health = SensorHealth(failures=3, max_backoff=900)
+        sensor = {'location': 'attic', 'error': {'type': 'SensorNotFound', 'value': 'DS18B20'}}
+        with contextlib.redirect_stderr(io.StringIO()):
+            delays = [health.record(sensor, 2.5) for _ in range(3000)]
+        self.assertEqual(delays[:6], [0, 0, 5.0, 10.0, 20.0, 40.0])
+        self.assertEqual(delays[-1], 900)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+"""Reloading an invalid sensor configuration keeps the current plan."""
+
+import copy
+import json
+import os
+import sys
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+from fetchsensors import plan
+from fetchsensors.collector import Collector
+from fetchsensors.plan import read_config
+
+CONFIG = {
+    'node': 'test',
+    'interval': 20,
+    'sensors': [
+        {'enabled': 1, 'sensor': 'DS18B20', 'id': '28-000000000001', 'location': 'attic',
+         'values': [{'measurand': 'temperature', 'correction': 0}]},
+        {'enabled': 1, 'sensor': 'HTU21', 'id': '0x40', 'location': 'cellar',
+         'values': [{'measurand': 'temperature', 'correction': 0},
+                    {'measurand': 'humidity', 'correction': 0}]},
+    ],
+}
+
+class FakeBus:
+    opened = 0
+
+    def __init__(self, bus_num):
+        FakeBus.opened += 1
+
+    def close(self):
+        FakeBus.opened -= 1
+
+class ReloadTest(unittest.TestCase):
+    def setUp(self):
+        FakeBus.opened = 0
+        # open_smbus imports smbus when the first bus is opened
+        patcher = mock.patch.dict(sys.modules, {'smbus': types.SimpleNamespace(SMBus=FakeBus)})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        fd, self.path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        self.addCleanup(os.unlink, self.path)
+        self.write(CONFIG)
+        config, sensors = read_config(self.path)
+        with mock.patch('time.sleep'):
+            self.collector = Collector(config, sensors, is_dry_run=True, config_file=self.path)
+        self.addCleanup(self.collector.close)
+
+    def write(self, config):
+        with open(self.path, 'w') as f:
+            json.dump(config, f)
+
+    def reload(self, change):
+        config = copy.deepcopy(CONFIG)
+        change(config)
+        self.write(config)
+        current = self.collector.plan
+        with mock.patch('sys.stderr'):
+            self.collector.reload()
+        self.assertIs(self.collector.plan, current)
+        self.assertEqual(FakeBus.opened, 1)
+
+    def test_zero_interval_with_window(self):
+        def change(config):
+            config['sensors'][0].update(interval=0, window=300)
+        self.reload(change)
+
+    def test_interval_as_string(self):
+        self.reload(lambda config: config.update(interval='20'))
+        self.reload(lambda config: config['sensors'][1].update(interval='20'))
+
+    def test_plan_failing_after_opening_buses(self):
+        with mock.patch.object(plan.Aggregator, '__init__', side_effect=RuntimeError('boom')):
+            self.reload(lambda config: None)
+
+if __name__ == '__main__':
+    unittest.main()
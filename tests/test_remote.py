@@ -0,0 +1,92 @@
+"""CachedFetch against a local stand-in for the Packet Broker API."""
+
+import threading
+import time
+import unittest
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from updateoled.remote import CachedFetch
+
+RECORD = b'{"updatedAt": "2026-10-16T12:00:00+00:00"}'
+
+class StandIn(BaseHTTPRequestHandler):
+    """Answer each GET with the next entry of the server's script."""
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(time.monotonic())
+        action = server.script[min(len(server.requests), len(server.script)) - 1]
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        if action == 'truncated':
+            # announce the full record, send only half of it and hang up
+            self.send_header('Content-Length', str(len(RECORD)))
+            self.end_headers()
+            self.wfile.write(RECORD[:len(RECORD) // 2])
+            self.close_connection = True
+        else:
+            body = RECORD if action == 'ok' else b'{"updatedAt": null}'
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class CachedFetchTest(unittest.TestCase):
+    def serve(self, script):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+        server.script = script
+        server.requests = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def fetcher(self, server, **kwargs):
+        fetch = CachedFetch(f'http://127.0.0.1:{server.server_port}/', timeout=2, **kwargs)
+        fetch.start()
+        self.addCleanup(fetch.stop)
+        return fetch
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail('timed out')
+            time.sleep(0.01)
+
+    def test_recovers_after_truncated_response(self):
+        server = self.serve(['truncated', 'ok'])
+        fetch = self.fetcher(server, ttl=60, retry_delay=0.05)
+        self.wait_for(lambda: fetch.value is not None)
+        self.assertEqual(fetch.value, datetime(2026, 10, 16, 12, tzinfo=timezone.utc))
+        self.assertEqual(fetch.failures, 0)
+        self.assertTrue(fetch.thread.is_alive())
+        self.assertEqual(len(server.requests), 2)
+
+    def test_null_timestamp_does_not_stop_the_thread(self):
+        server = self.serve(['null', 'ok'])
+        fetch = self.fetcher(server, ttl=60, retry_delay=0.05)
+        self.wait_for(lambda: fetch.value is not None)
+        self.assertTrue(fetch.thread.is_alive())
+
+    def test_backs_off_exponentially(self):
+        server = self.serve(['truncated'] * 4 + ['ok'])
+        fetch = self.fetcher(server, ttl=60, retry_delay=0.1, max_retry_delay=0.3)
+        self.wait_for(lambda: fetch.value is not None)
+        gaps = [b - a for a, b in zip(server.requests, server.requests[1:])]
+        # 0.1, 0.2, then capped at 0.3
+        for gap, expected in zip(gaps, [0.1, 0.2, 0.3, 0.3]):
+            self.assertGreaterEqual(gap, expected - 0.01)
+            self.assertLess(gap, expected + 0.15)
+        self.assertEqual(fetch.next_delay(), 60)
+
+    def test_backoff_stays_capped(self):
+        fetch = CachedFetch('http://127.0.0.1:1/', retry_delay=2.5, max_retry_delay=600)
+        fetch.failures = 5000
+        self.assertEqual(fetch.next_delay(), 600)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+"""Bulk conversion of DS18B20 probes on a simulated 1-Wire tree."""
+
+import tempfile
+import time
+import unittest
+
+from fetchsensors.readers import SensorReaders, refineSensorConfig, w1_trigger
+from fetchsensors.scheduler import AcquisitionScheduler
+from fetchsensors.simulation import FakeW1Tree
+
+IDS = ['28-000000000001', '28-000000000002', '28-000000000003']
+
+class BulkReadTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.tree = FakeW1Tree(directory.name, IDS, temperature=21.5, conversion_time=0.1)
+        self.sensors = refineSensorConfig([
+            {'sensor': 'DS18B20', 'id': device_id, 'location': f'probe{i}',
+             'values': [{'measurand': 'temperature', 'correction': 0}]}
+            for i, device_id in enumerate(IDS)
+        ])
+        self.directory = directory.name
+
+    def scheduler(self, trigger):
+        readers = SensorReaders(self.sensors, w1_devices=self.directory, w1_trigger=trigger)
+        self.assertTrue(readers.w1_bulk)
+        # every single read takes a conversion time, wherever it is called from
+        readers.read_sensor = self.tree.wrap(readers.read_sensor)
+        scheduler = AcquisitionScheduler(self.sensors, readers.read_sensor, interval=20,
+                                         read_w1=readers.read_w1)
+        self.addCleanup(scheduler.shutdown)
+        return scheduler
+
+    def assertAllRead(self):
+        for s in self.sensors:
+            self.assertEqual(s['error'], {})
+            self.assertEqual(s['values'][0]['raw'], 21.5)
+
+    def test_one_trigger_reads_all_probes(self):
+        cycle = self.scheduler(self.tree.wrap_trigger(w1_trigger)).run_cycle()
+        self.assertEqual(self.tree.bulk_reads, 1)
+        self.assertAllRead()
+        # the conversion is waited for once, in the trigger write
+        self.assertLess(cycle, 0.2)
+
+    def test_probes_are_read_in_parallel_when_the_trigger_fails(self):
+        def trigger(master):
+            raise PermissionError(master)
+        start = time.monotonic()
+        self.scheduler(trigger).run_cycle()
+        self.assertAllRead()
+        self.assertLess(time.monotonic() - start, 0.2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -31,7 +31,7 @@ uv sync --project "$INSTALL_DIR"
 
 # Restart running services
 print_status "Restarting services..."
-SERVICES=("fetchsensors" "updateoled")
+SERVICES=("fetchsensors" "updateoled" "raspistatus")
 for service in "${SERVICES[@]}"; do
     if systemctl is-active --quiet "$service.service"; then
         systemctl restart "$service.service"
@@ -0,0 +1 @@
+"""Show system and sensor status on an SSD1306 OLED display."""
@@ -0,0 +1,96 @@
+"""Latest sensor values for the OLED display, taken from the fetchsensors MQTT topic.
+
+updateoled subscribes to the topic fetchsensors publishes on and keeps the
+most recent value of every location/measurand in memory, together with the
+time it was received.
+"""
+
+import sys
+import threading
+import time
+
+def parse_line(line):
+    """Split an Influx line-protocol record into (measurement, tags, fields).
+
+    Only the subset fetchsensors produces is supported: no escaped
+    characters and no spaces in tag or field values.
+    """
+    parts = line.strip().split(' ')
+    if len(parts) < 2:
+        return None
+    key = parts[0].split(',')
+    tags = dict(tag.split('=', 1) for tag in key[1:] if '=' in tag)
+    fields = dict(field.split('=', 1) for field in parts[1].split(',') if '=' in field)
+    return key[0], tags, fields
+
+class SensorValues:
+    """Latest value and time received of every location/measurand."""
+
+    def __init__(self):
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def update(self, payload, now=None):
+        """Store the values of a (possibly batched) line-protocol payload."""
+        if now is None:
+            now = time.monotonic()
+        for line in payload.splitlines():
+            record = parse_line(line)
+            if record is None:
+                continue
+            measurand, tags, fields = record
+            if measurand == 'error' or 'location' not in tags or 'value' not in fields:
+                continue
+            with self.lock:
+                self.values[(tags['location'], measurand)] = (float(fields['value']), now)
+
+    def get(self, location, measurand, now=None):
+        """Return (value, age in seconds) or None if nothing was received yet."""
+        with self.lock:
+            entry = self.values.get((location, measurand))
+        if entry is None:
+            return None
+        if now is None:
+            now = time.monotonic()
+        value, received = entry
+        return value, now - received
+
+class SensorFeed(SensorValues):
+    """SensorValues kept up to date from the fetchsensors MQTT topic."""
+
+    def __init__(self, server, topic, port=1883):
+        import paho.mqtt.client as mqtt
+        super().__init__()
+        self.topic = topic
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+        self.client.reconnect_delay_set(min_delay=1, max_delay=60)
+        self.client.connect_async(server, port, 60)
+
+    def start(self):
+        self.client.loop_start()
+
+    def stop(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        client.subscribe(self.topic)
+
+    def _on_message(self, client, userdata, msg):
+        try:
+            self.update(msg.payload.decode())
+        except (UnicodeDecodeError, ValueError) as e:
+            print(f"Ignoring message on {msg.topic}: {e}", file=sys.stderr, flush=True)
+
+def format_age(seconds):
+    """Compact age for the display: 45s, 12m, 3h, 2d."""
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m"
+    if seconds < 86400:
+        return f"{seconds // 3600}h"
+    return f"{seconds // 86400}d"
@@ -0,0 +1,63 @@
+"""Rendered strings for the OLED status screen.
+
+Laying out text with a FreeType font costs far more than copying its pixels.
+A GlyphCache therefore renders every string once, into a mode '1' mask, and
+keeps the most recently used ones together with their advance widths. A
+frame is then put together by pasting masks: values that did not change,
+like most of the screen between two frames, cost a paste instead of a text
+layout.
+"""
+
+from collections import OrderedDict
+from PIL import Image
+from PIL import ImageDraw
+
+GLYPH_CACHE_SIZE = 128
+
+def scratch():
+    """Return an ImageDraw of a mode '1' image, which measures text as it is drawn on the display."""
+    return ImageDraw.Draw(Image.new('1', (1, 1)))
+
+def render_text(measure, font, text):
+    """Draw text like ImageDraw.text((0, 0)) would, return (mask, advance width)."""
+    _, _, right, bottom = measure.textbbox((0, 0), text, font=font)
+    image = Image.new('1', (max(int(right), 1), max(int(bottom), 1)))
+    ImageDraw.Draw(image).text((0, 0), text, font=font, fill=255)
+    return image, measure.textlength(text, font=font)
+
+def render_celsius(font):
+    """Draw the degree sign as a small circle followed by 'C', return (mask, advance width)."""
+    measure = scratch()
+    _, _, right, bottom = measure.textbbox((0, 0), "C", font=font)
+    image = Image.new('1', (5 + max(int(right), 1), max(int(bottom), 6)))
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((0, 2, 3, 5), outline=255, fill=0)
+    draw.text((5, 0), "C", font=font, fill=255)
+    return image, 5 + measure.textlength("C", font=font)
+
+class GlyphCache:
+    """LRU cache of rendered strings: text -> (mask, advance width)."""
+
+    def __init__(self, font, size=GLYPH_CACHE_SIZE):
+        self.font = font
+        self.size = size
+        self.measure = scratch()
+        self.glyphs = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text):
+        glyph = self.glyphs.get(text)
+        if glyph is not None:
+            self.glyphs.move_to_end(text)
+            self.hits += 1
+            return glyph
+        self.misses += 1
+        glyph = render_text(self.measure, self.font, text)
+        self.glyphs[text] = glyph
+        if len(self.glyphs) > self.size:
+            self.glyphs.popitem(last=False)
+        return glyph
+
+    def stats(self):
+        return f"glyph cache {len(self.glyphs)} strings, {self.hits} hits, {self.misses} misses"
@@ -0,0 +1,67 @@
+"""Background fetch of remote status shown on the OLED display.
+
+The render loop only reads the cached value of a CachedFetch. A background
+thread refreshes it every ttl seconds and backs off exponentially while the
+remote side is unreachable, so a network stall never blocks a frame.
+"""
+
+import json
+import sys
+import threading
+from datetime import datetime
+
+GATEWAY_URL = 'https://mapper.packetbroker.net/api/v2/gateways/netID=000013,tenantID=ttn,id=eui-b827ebfffe06902a'
+TTL = 60
+TIMEOUT = 10
+RETRY_DELAY = 5
+MAX_RETRY_DELAY = 600
+# doublings of the retry delay are counted up to this, far past any
+# max_retry_delay; beyond about 1023 a float delay would overflow
+MAX_DOUBLINGS = 64
+
+def parse_updated_at(data):
+    """Return the 'updatedAt' timestamp of a Packet Broker gateway record."""
+    return datetime.fromisoformat(json.loads(data)['updatedAt'])
+
+class CachedFetch:
+    def __init__(self, url, parse=parse_updated_at, ttl=TTL, timeout=TIMEOUT,
+                 retry_delay=RETRY_DELAY, max_retry_delay=MAX_RETRY_DELAY):
+        self.url = url
+        self.parse = parse
+        self.ttl = ttl
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.value = None
+        self.failures = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='fetch', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def fetch(self):
+        """Fetch and parse the resource once, updating the cache."""
+        import urllib.request
+        with urllib.request.urlopen(self.url, timeout=self.timeout) as response:
+            self.value = self.parse(response.read())
+
+    def next_delay(self):
+        """Seconds until the next fetch: the ttl, or the backoff after failures."""
+        if not self.failures:
+            return self.ttl
+        doublings = min(self.failures - 1, MAX_DOUBLINGS)
+        return min(self.retry_delay * 2 ** doublings, self.max_retry_delay)
+
+    def _run(self):
+        while not self.stopped.is_set():
+            try:
+                self.fetch()
+                self.failures = 0
+            except Exception as e:
+                self.failures += 1
+                print(f"Fetching {self.url} failed ({self.failures}x): {e}", file=sys.stderr, flush=True)
+            self.stopped.wait(self.next_delay())
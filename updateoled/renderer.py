@@ -0,0 +1,101 @@
+"""Change-detecting frame transfer to an SSD1306 display.
+
+The SSD1306 memory is organised in pages of 8 pixel rows, one byte per page
+and column. The renderer keeps the last frame sent in that layout, compares
+every new frame against it and only transfers the column range that changed
+in each page. Unchanged frames cause no bus traffic at all.
+"""
+
+import time
+from contextlib import nullcontext
+from PIL import Image
+
+SET_COL_ADDR = 0x21
+SET_PAGE_ADDR = 0x22
+CONTROL_CMD = 0x00   # Co=0, D/C=0: the following bytes are commands
+CONTROL_DATA = 0x40  # Co=0, D/C=1: the following bytes are display data
+
+def page_bytes(image):
+    """Convert a mode '1' image into SSD1306 page layout.
+
+    Returns one bytes object per page, each holding one byte per column with
+    the top row of the page in the least significant bit.
+    """
+    pages = image.height // 8
+    # after the flip and transpose every image row is one display column,
+    # packed from the bottom row (MSB) of the last page to the top row (LSB)
+    # of the first page
+    columns = image.transpose(Image.Transpose.FLIP_TOP_BOTTOM).transpose(Image.Transpose.TRANSPOSE).tobytes()
+    return [columns[pages - 1 - p::pages] for p in range(pages)]
+
+def changed_span(old, new):
+    """Return the first and last index where old and new differ, or None."""
+    if old == new:
+        return None
+    first = 0
+    while old[first] == new[first]:
+        first += 1
+    last = len(new) - 1
+    while old[last] == new[last]:
+        last -= 1
+    return first, last
+
+class DirtyRenderer:
+    """Transfer frames to disp, holding bus around every bus write.
+
+    bus is a context manager such as a BusArbiter handle when the display
+    shares its I2C bus with other users in the process.
+    """
+
+    def __init__(self, disp, bus=None):
+        self.disp = disp
+        self.bus = bus if bus is not None else nullcontext()
+        self.previous = None
+        self.frames = 0
+        self.skipped = 0
+        self.bytes_sent = 0
+        self.last_bytes = 0
+        self.last_time = 0.0
+
+    def clear(self):
+        """Blank the display and remember it as the last frame."""
+        self.disp.fill(0)
+        with self.bus:
+            self.disp.show()
+        self.previous = [bytes(self.disp.width)] * (self.disp.height // 8)
+
+    def _write(self, control, data):
+        device = self.disp.i2c_device
+        with device:
+            device.write(bytes([control]) + data)
+        return len(data) + 1
+
+    def show(self, image):
+        """Send the parts of image that differ from the last frame."""
+        start = time.perf_counter()
+        pages = page_bytes(image)
+        sent = 0
+        for p, data in enumerate(pages):
+            if self.previous is None:
+                span = (0, len(data) - 1)
+            else:
+                span = changed_span(self.previous[p], data)
+            if span is None:
+                continue
+            first, last = span
+            # the address window and its data must not be split by other transfers
+            with self.bus:
+                sent += self._write(CONTROL_CMD, bytes([SET_COL_ADDR, first, last, SET_PAGE_ADDR, p, p]))
+                sent += self._write(CONTROL_DATA, data[first:last + 1])
+        self.previous = pages
+        self.frames += 1
+        if not sent:
+            self.skipped += 1
+        self.last_bytes = sent
+        self.bytes_sent += sent
+        self.last_time = time.perf_counter() - start
+
+    def stats(self):
+        return (f"frames {self.frames}, unchanged {self.skipped}, "
+                f"{self.bytes_sent} bytes sent, last frame {self.last_bytes} bytes "
+                f"in {self.last_time * 1000:.1f} ms")
@@ -0,0 +1,145 @@
+"""The status screen of updateoled.
+
+StatusScreen draws uptime, load, memory and disk usage, two configured
+sensor values and the last time the TTN gateway was seen into a mode '1'
+image. Transferring the image is left to the caller, so the same screen is
+used by updateoled.py and by the combined raspistatus daemon.
+
+What goes where is a layout, a list of elements. A text element is a
+template such as "Up: {uptime}". A value element is one of the configured
+display values. Text without fields and the labels of values are drawn
+once, into a base image. Every frame starts from a copy of the base image,
+and only the fields are pasted on top from a GlyphCache.
+"""
+
+from string import Formatter
+from zoneinfo import ZoneInfo
+from PIL import Image
+from PIL import ImageFont
+from .feed import format_age
+from .layout import GlyphCache, render_celsius
+
+# values shown on the screen unless configured in the 'display' section
+DEFAULT_DISPLAY_VALUES = [
+    {"label": "In", "location": "ttnbox", "measurand": "temperature"},
+    {"label": "Out", "location": "attic", "measurand": "temperature"},
+]
+
+# the screen unless configured in 'display.layout'; 'value' indexes 'display.values'
+DEFAULT_LAYOUT = [
+    {"text": "Up: {uptime}", "y": 0, "align": "center"},
+    {"text": "{cpu} {memory} {disk}", "y": 15, "align": "center"},
+    {"value": 0, "x": 0, "y": 27},
+    {"value": 1, "x": 64, "y": 27},
+    {"text": "TTN-GW last seen", "y": 42, "align": "center"},
+    {"text": "{gateway}", "y": 54, "align": "center"},
+]
+
+FIELDS = ('uptime', 'cpu', 'memory', 'disk', 'gateway')
+
+UNITS = {
+    "humidity": "%",
+    "pressure": "hPa",
+}
+
+class StatusScreen:
+    """Draw the status screen from values (a SensorValues or None), gateway and sysinfo."""
+
+    def __init__(self, width, height, config, values, gateway, sysinfo):
+        display = config.get('display', {})
+        self.display_values = display.get('values', DEFAULT_DISPLAY_VALUES)
+        self.local_timezone = ZoneInfo(display.get('timezone', 'Europe/Berlin'))
+        self.values = values
+        self.gateway = gateway
+        self.sysinfo = sysinfo
+
+        # Create blank images for drawing.
+        # Make sure to create images with mode '1' for 1-bit color.
+        self.width = width
+        self.height = height
+        self.base = Image.new('1', (width, height))
+        self.image = Image.new('1', (width, height))
+
+        # Load default font.
+        self.font = ImageFont.load_default()
+        self.glyphs = GlyphCache(self.font)
+        self.celsius = render_celsius(self.font)
+
+        self.texts = []   # (template, x, y, align) of the text elements with fields
+        self.items = []   # (display value, x, y) of the values, x is after the label
+        self.fields = {}  # field name -> function returning its text
+        for element in display.get('layout', DEFAULT_LAYOUT):
+            self.add_element(element)
+
+    def add_element(self, element):
+        """Add a layout element, drawing what never changes into the base image."""
+        x, y = element.get('x', 0), element.get('y', 0)
+        if 'value' in element:
+            if element['value'] >= len(self.display_values):
+                return
+            item = self.display_values[element['value']]
+            x = self.paste(self.base, item['label'] + ":", x, y)
+            self.items.append((item, x, y))
+        elif 'text' in element:
+            template = element['text']
+            align = element.get('align', 'left')
+            if align not in ('left', 'center', 'right'):
+                raise ValueError(f"unknown alignment of display text {template!r}: {align}")
+            names = [name for _, name, _, _ in Formatter().parse(template) if name is not None]
+            if not names:
+                self.paste(self.base, template.format(), x, y, align)
+                return
+            for name in names:
+                if name not in FIELDS:
+                    raise ValueError(f"unknown field in display text {template!r}: {name}")
+                self.fields[name] = self.gateway_text if name == 'gateway' else getattr(self.sysinfo, name + '_text')
+            self.texts.append((template, x, y, align))
+        else:
+            raise ValueError(f"display layout element needs 'text' or 'value': {element}")
+
+    def paste(self, image, text, x, y, align='left'):
+        """Draw text at y, return the x position after it.
+
+        x is the left edge of left-aligned text and the right margin of
+        right-aligned text; centered text ignores it.
+        """
+        mask, advance = self.glyphs.get(text)
+        return self.paste_glyph(image, mask, advance, x, y, align)
+
+    def paste_glyph(self, image, mask, advance, x, y, align='left'):
+        if align == 'center':
+            x = max(0, (self.width - advance) / 2)
+        elif align == 'right':
+            x = self.width - x - advance
+        image.paste(255, (round(x), y), mask)
+        return x + advance
+
+    def gateway_text(self):
+        if self.gateway.value is None:
+            return "--"
+        return self.gateway.value.astimezone(self.local_timezone).strftime("%Y-%m-%d %H:%M:%S")
+
+    def draw_value(self, image, x, y, item):
+        """Draw 'value unit age' of a configured display value after its label."""
+        reading = self.values.get(item['location'], item['measurand']) if self.values else None
+        x = self.paste(image, "--" if reading is None else f"{reading[0]:.1f}", x, y) + 1
+        if item['measurand'] == 'temperature':
+            x = self.paste_glyph(image, *self.celsius, x, y)
+        elif item['measurand'] in UNITS:
+            x = self.paste(image, UNITS[item['measurand']], x, y)
+        if reading is not None:
+            self.paste(image, format_age(reading[1]), x + 2, y)
+
+    def render(self):
+        """Draw the current status and return the image."""
+        image = self.image
+        image.paste(self.base)
+        fields = {name: str(text()) for name, text in self.fields.items()}
+        for template, x, y, align in self.texts:
+            self.paste(image, template.format(**fields), x, y, align)
+        for item, x, y in self.items:
+            self.draw_value(image, x, y, item)
+        return image
+
+    def stats(self):
+        return self.glyphs.stats()
@@ -0,0 +1,98 @@
+"""System metrics for the OLED status screen, read without spawning processes.
+
+Load, memory and uptime come from /proc, disk usage from os.statvfs. The
+/proc files are kept open and re-read with pread, which costs one system
+call per value instead of a fork of top/free/df/uptime.
+"""
+
+import os
+
+class ProcFile:
+    """A /proc file that stays open and is read from the start on every call."""
+
+    def __init__(self, path, size=4096):
+        self.path = path
+        self.size = size
+        self.fd = os.open(path, os.O_RDONLY)
+
+    def read(self):
+        return os.pread(self.fd, self.size, 0).decode()
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+def parse_meminfo(text):
+    """Return the fields of /proc/meminfo in kB."""
+    info = {}
+    for line in text.splitlines():
+        key, _, value = line.partition(':')
+        fields = value.split()
+        if fields:
+            info[key] = int(fields[0])
+    return info
+
+def disk_usage_percent(path='/'):
+    """Used space in percent, rounded up like df's Use% column."""
+    st = os.statvfs(path)
+    used = st.f_blocks - st.f_bfree
+    total = used + st.f_bavail
+    if total == 0:
+        return 0
+    return -(-used * 100 // total)
+
+def format_uptime(seconds):
+    """Format an uptime like 'uptime' does after the sed in the old script."""
+    minutes = int(seconds) // 60
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    parts = []
+    if days:
+        parts.append('1 day' if days == 1 else f"{days} d")
+    if hours:
+        parts.append(f"{hours} h, {minutes} m")
+    else:
+        parts.append(f"{minutes} min")
+    return ', '.join(parts)
+
+class SystemMetrics:
+    def __init__(self, proc='/proc', disk_path='/'):
+        self.loadavg = ProcFile(os.path.join(proc, 'loadavg'))
+        self.meminfo = ProcFile(os.path.join(proc, 'meminfo'), size=8192)
+        self.uptime_file = ProcFile(os.path.join(proc, 'uptime'))
+        self.disk_path = disk_path
+
+    def load(self):
+        """1 minute load average."""
+        return float(self.loadavg.read().split()[0])
+
+    def memory_percent(self):
+        """Used memory in percent, computed like free's 'used' column."""
+        info = parse_meminfo(self.meminfo.read())
+        total = info['MemTotal']
+        if 'MemAvailable' in info:
+            used = total - info['MemAvailable']
+        else:
+            used = total - info['MemFree'] - info.get('Buffers', 0) - info.get('Cached', 0)
+        return used * 100 / total
+
+    def uptime(self):
+        """Seconds since boot."""
+        return float(self.uptime_file.read().split()[0])
+
+    def cpu_text(self):
+        return f"C: {self.load():.2f}"
+
+    def memory_text(self):
+        return f"M: {self.memory_percent():.0f}%"
+
+    def disk_text(self):
+        return f"D: {disk_usage_percent(self.disk_path)}%"
+
+    def uptime_text(self):
+        return format_uptime(self.uptime())
+
+    def close(self):
+        for f in (self.loadavg, self.meminfo, self.uptime_file):
+            f.close()